@@ -1,13 +1,25 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import argparse
+import collections
+import contextlib
 import copy
+import csv
+import importlib
+import io
+import itertools
+import json
+import locale
 import os
+import pickle
 import re
+import signal
+import sys
+import time
+from array import array
 from enum import Enum
 import datetime
-import openpyxl
-from openpyxl.worksheet import *
 
 
 class Severity(Enum):
@@ -22,15 +34,6 @@ class Severity(Enum):
         return self.value[1]
 
 
-class Check(Enum):
-    """Header of checks"""
-    Caption = 0
-    Command = 1
-    Output = 2
-    Element = 3
-    AlarmsReference = 4
-
-
 class Alarm(Enum):
     """Header of alarms"""
     specificProblem = 0
@@ -43,6 +46,10 @@ class Alarm(Enum):
 
 class ZbCheckRow():
     """ строка страницы файла Support Report """
+    __slots__ = ('CheckName', 'Severity', 'Observation', 'Order', 'DateOf', 'NodeName', 'alarmsDetail',
+                 'alarmsCritical', 'alarmsMajor', 'alarmsMinor', 'alarmsWarning', 'alarmsTotal', 'alarmsCollision',
+                 'values')
+
     def __init__(self, checkname, order, severity=Severity.Ok, observation='No alarms', dateof='', nodename=''):
         super(ZbCheckRow, self).__init__()
         self.CheckName = checkname
@@ -58,270 +65,1314 @@ class ZbCheckRow():
         self.alarmsWarning = 0
         self.alarmsTotal = 0
         self.alarmsCollision = 0
+        # Values parsed by the check (KPI counters, alarm counts, release, uptime) for the history, see ZbHistory
+        self.values = {}
 
     def __str__(self):
         return '\t'.join([str(self.Order), self.CheckName, str(self.Severity), self.Observation])
 
 
-def copy_rows(self, row_idx, cnt, above=False, copy_style=True, fill_formulae=True):
-    """Inserts new (empty) rows into worksheet at specified row index.
-    :param self: itself
-    :param row_idx: Row index specifying where to insert new rows.
-    :param cnt: Number of rows to insert.
-    :param above: Set True to insert rows above specified row index.
-    :param copy_style: Set True if new rows should copy style of immediately above row.
-    :param fill_formulae: Set True if new rows should take on formula from immediately above row, filled with references new to rows.
-    Usage:
-    * insert_rows(2, 10, above=True, copy_style=False)
+class ZbResultTable():
+    """Report rows of many nodes stored by columns: a row is a position in the arrays of numbers, the strings
+    (node, log date, check, observation, date, alarms detail) are interned in self.strings and stored as their
+    numbers. The rows are filtered by the columns with select, row makes ZbCheckRow of a position back.
+    save and load keep the table in a columnar file: a JSON header line (strings and columns) and the bytes
+    of the arrays one after another.
     """
-    CELL_RE = re.compile("(?P<col>\$?[A-Z]+)(?P<row>\$?\d+)")
-    row_idx = row_idx - 1 if above else row_idx
+    counters = ('alarmsCritical', 'alarmsMajor', 'alarmsMinor', 'alarmsWarning', 'alarmsTotal', 'alarmsCollision')
+    columns = ('node', 'logDate', 'order', 'severity', 'checkName', 'observation', 'dateOf', 'alarmsDetail') + counters
+    severities = {severity.value[0]: severity for severity in Severity}
+
+    def __init__(self):
+        super(ZbResultTable, self).__init__()
+        self.strings = []
+        self.stringIds = {}
+        self.node = array('I')
+        self.logDate = array('I')
+        self.order = array('H')
+        self.severity = array('B')
+        self.checkName = array('I')
+        self.observation = array('I')
+        self.dateOf = array('I')
+        self.alarmsDetail = array('I')
+        self.alarms = {counter: array('I') for counter in self.counters}
+
+    def __len__(self):
+        return len(self.severity)
+
+    def string_id(self, string):
+        stringId = self.stringIds.get(string)
+        if stringId is None:
+            stringId = self.stringIds[string] = len(self.strings)
+            self.strings.append(string)
+        return stringId
+
+    def column(self, name):
+        return self.alarms[name] if name in self.alarms else getattr(self, name)
+
+    def extend(self, rows, logdate=''):
+        """Appends ZbCheckRow's of a log, returns the positions of the first appended row and the one after the last"""
+        start = len(self)
+        logDate = self.string_id(logdate or '')
+        for row in rows:
+            self.node.append(self.string_id(row.NodeName))
+            self.logDate.append(logDate)
+            self.order.append(row.Order)
+            self.severity.append(row.Severity.value[0])
+            self.checkName.append(self.string_id(row.CheckName))
+            self.observation.append(self.string_id(row.Observation))
+            self.dateOf.append(self.string_id(row.DateOf))
+            self.alarmsDetail.append(self.string_id('\n'.join(row.alarmsDetail)))
+            for counter in self.counters:
+                self.alarms[counter].append(getattr(row, counter))
+        return start, len(self)
+
+    def row(self, num):
+        """ZbCheckRow of the position num"""
+        strings = self.strings
+        row = ZbCheckRow(checkname=strings[self.checkName[num]], order=self.order[num],
+                         severity=self.severities[self.severity[num]], observation=strings[self.observation[num]],
+                         dateof=strings[self.dateOf[num]], nodename=strings[self.node[num]])
+        detail = strings[self.alarmsDetail[num]]
+        row.alarmsDetail = detail.split('\n') if detail else []
+        for counter in self.counters:
+            setattr(row, counter, self.alarms[counter][num])
+        return row
+
+    def rows(self, nums=None):
+        """ZbCheckRow's of the positions nums, of all the rows if nums is None"""
+        return [self.row(num) for num in (range(len(self)) if nums is None else nums)]
+
+    def select(self, severities=None, nodes=None):
+        """Positions of the rows whose severity is one of severities and node one of nodes (None - any)"""
+        nums = range(len(self))
+        if severities is not None:
+            codes = set(severity.value[0] for severity in severities)
+            nums = [num for num, code in enumerate(self.severity) if code in codes]
+        if nodes is not None:
+            nodeIds = set(self.stringIds[node] for node in nodes if node in self.stringIds)
+            nums = [num for num in nums if self.node[num] in nodeIds]
+        return list(nums)
+
+    def problems(self):
+        """Positions of the rows whose severity is not Ok"""
+        return self.select(severity for severity in Severity if severity != Severity.Ok)
+
+    def summary(self):
+        """Positions of the rows whose severity is not Ok by severity (Critical first), node and check order"""
+        strings, node, severity, order = self.strings, self.node, self.severity, self.order
+        return sorted(self.problems(), key=lambda num: (severity[num], strings[node[num]], order[num]))
+
+    def save(self, f):
+        """Writes the table into the file f opened in binary mode"""
+        header = {'rows': len(self), 'byteorder': sys.byteorder, 'strings': self.strings,
+                  'columns': [(name, self.column(name).typecode, self.column(name).itemsize) for name in self.columns]}
+        f.write(json.dumps(header).encode('utf-8') + b'\n')
+        for name in self.columns:
+            self.column(name).tofile(f)
+
+    @classmethod
+    def load(cls, f):
+        """Table from the file f opened in binary mode, written by save"""
+        table = cls()
+        header = json.loads(f.readline().decode('utf-8'))
+        table.strings = header['strings']
+        table.stringIds = {string: num for num, string in enumerate(table.strings)}
+        for name, typecode, itemsize in header['columns']:
+            column = table.column(name)
+            if column.typecode != typecode or column.itemsize != itemsize:
+                raise ValueError('Column %s is %s of %d bytes, not %s of %d' %
+                                 (name, typecode, itemsize, column.typecode, column.itemsize))
+            column.fromfile(f, header['rows'])
+            if header['byteorder'] != sys.byteorder:
+                column.byteswap()
+        return table
+
+
+# openpyxl is imported by load_openpyxl on the first use of a workbook, checking the logs does not need it
+openpyxl = Cell = Comment = StyleArray = None
+
+
+def load_openpyxl():
+    """openpyxl module, imported on the first call; its worksheets get reserve_rows and its workbooks
+    copy_worksheet"""
+    global openpyxl, Cell, Comment, StyleArray
+    if openpyxl is None:
+        import openpyxl as module
+        from openpyxl.cell import Cell
+        from openpyxl.comments import Comment
+        from openpyxl.styles.styleable import StyleArray
+        from openpyxl.worksheet import Worksheet
+        Worksheet.reserve_rows = reserve_rows
+        if not hasattr(module.Workbook, 'copy_worksheet'):
+            module.Workbook.copy_worksheet = copy_worksheet
+        openpyxl = module
+    return openpyxl
+
+
+CELL_RE = re.compile(r"(?P<col>\$?[A-Z]+)(?P<row>\$?\d+)")
 
+
+def shift_refs(row_idx, cnt):
+    """Replacement function for CELL_RE.sub: moves the references to the rows below row_idx down by cnt"""
     def replace(m):
         row = m.group('row')
         prefix = "$" if row.find("$") != -1 else ""
-        row = int(row.replace("$",""))
+        row = int(row.replace("$", ""))
         row += cnt if row > row_idx else 0
         return m.group('col') + prefix + str(row)
-    # First, we shift all cells down cnt rows...
-    old_cells = set()
+    return replace
+
+
+def reserve_rows(self, row_idx, cnt):
+    """Inserts cnt copies of the row row_idx into worksheet right below it.
+    The rows below are shifted and all the formulae and merged cells of the sheet are rewritten only once,
+    the values, styles and row dimension of the new rows are copied from the template row in bulk.
+    Formulae of the template row are copied with its references to the template row moved to the new rows.
+    :param self: itself
+    :param row_idx: Row index of the template row.
+    :param cnt: Number of rows to insert.
+    Usage:
+    * ws.reserve_rows(5, 20)
+    """
+    if cnt < 1:
+        return
+    replace = shift_refs(row_idx, cnt)
+    # First, we shift all cells below the template row and all references to them...
+    template = []
+    cells = dict()
     old_fas = set()
-    new_cells = dict()
     new_fas = dict()
     for c in self._cells.values():
         old_coor = c.coordinate
-        # Shift all references to anything below row_idx
         if c.data_type == Cell.TYPE_FORMULA:
-            c.value = CELL_RE.sub(
-                replace,
-                c.value
-            )
-            # Here, we need to properly update the formula references to reflect new row indices
+            c.value = CELL_RE.sub(replace, c.value)
             if old_coor in self.formula_attributes and 'ref' in self.formula_attributes[old_coor]:
-                self.formula_attributes[old_coor]['ref'] = CELL_RE.sub(
-                    replace,
-                    self.formula_attributes[old_coor]['ref']
-                )
-        # Do the magic to set up our actual shift    
-        if c.row > row_idx:
-            old_coor = c.coordinate
-            old_cells.add((c.row,c.col_idx))
+                self.formula_attributes[old_coor]['ref'] = CELL_RE.sub(replace, self.formula_attributes[old_coor]['ref'])
+        if c.row == row_idx:
+            template.append(c)
+        elif c.row > row_idx:
             c.row += cnt
-            new_cells[(c.row,c.col_idx)] = c
             if old_coor in self.formula_attributes:
                 old_fas.add(old_coor)
-                fa = self.formula_attributes[old_coor].copy()
-                new_fas[c.coordinate] = fa
-    for coor in old_cells:
-        del self._cells[coor]
-    self._cells.update(new_cells)
+                new_fas[c.coordinate] = self.formula_attributes[old_coor]
+        cells[(c.row, c.col_idx)] = c
+    self._cells = cells
     for fa in old_fas:
         del self.formula_attributes[fa]
     self.formula_attributes.update(new_fas)
-    # Next, we need to shift all the Row Dimensions below our new rows down by cnt...
-    for row in range(len(self.row_dimensions)-1+cnt,row_idx+cnt,-1):
-        new_rd = copy.copy(self.row_dimensions[row-cnt])
+    # ...and the row dimensions below it
+    for row in sorted((row for row in self.row_dimensions if row > row_idx), reverse=True):
+        rd = self.row_dimensions.pop(row)
+        rd.index = row + cnt
+        self.row_dimensions[row + cnt] = rd
+    # Now, create the new rows as copies of the template one
+    template_ref = re.compile(r"(\$?[A-Z]{1,3}\$?)%d(?!\d)" % row_idx)
+    for row in range(row_idx + 1, row_idx + cnt + 1):
+        new_rd = copy.copy(self.row_dimensions[row_idx])
         new_rd.index = row
         self.row_dimensions[row] = new_rd
-        del self.row_dimensions[row-cnt]
-    # Now, create our new rows, with all the pretty cells
-    row_idx += 1
-    for row in range(row_idx,row_idx+cnt):
-        # Create a Row Dimension for our new row
-        new_rd = copy.copy(self.row_dimensions[row-1])
-        new_rd.index = row
-        self.row_dimensions[row] = new_rd
-        for col in range(1,self.max_column):
-            col = get_column_letter(col)
-            cell = self.cell('%s%d'%(col,row))
-            cell.value = self.cell('%s%d'%(col,row-1)).value
-            source = self.cell('%s%d'%(col,row-1))
-            if copy_style:
-                cell.number_format = source.number_format
-                cell.font        = source.font.copy()
-                cell.alignment = source.alignment.copy()
-                cell.border    = source.border.copy()
-                cell.fill        = source.fill.copy()
-            if fill_formulae and source.data_type == Cell.TYPE_FORMULA:
+        for source in template:
+            cell = self.cell(row=row, column=source.col_idx)
+            cell.value = source.value
+            if source.has_style:
+                cell._style = StyleArray(source._style)
+            if source.data_type == Cell.TYPE_FORMULA:
                 s_coor = source.coordinate
                 if s_coor in self.formula_attributes and 'ref' not in self.formula_attributes[s_coor]:
-                    fa = self.formula_attributes[s_coor].copy()
-                    self.formula_attributes[cell.coordinate] = fa
-                # print("Copying formula from cell %s%d to %s%d"%(col,row-1,col,row))
-                cell.value = re.sub(
-                    "(\$?[A-Z]{1,3}\$?)%d"%(row - 1),
-                    lambda m: m.group(1) + str(row),
-                    source.value
-                )     
+                    self.formula_attributes[cell.coordinate] = self.formula_attributes[s_coor].copy()
+                cell.value = template_ref.sub(lambda m: m.group(1) + str(row), source.value)
                 cell.data_type = Cell.TYPE_FORMULA
     # Check for Merged Cell Ranges that need to be expanded to contain new cells
     for cr_idx, cr in enumerate(self.merged_cell_ranges):
-        self.merged_cell_ranges[cr_idx] = CELL_RE.sub(
-            replace,
-            cr
-        )
-Worksheet.copy_rows = copy_rows
+        self.merged_cell_ranges[cr_idx] = CELL_RE.sub(replace, cr)
 
 
-class ZbAnalyser():
-    """zbAnalyser! И этим всё сказано"""
-    def __init__(self):
-        super(ZbAnalyser, self).__init__()
-        self.currentTemplate = os.listdir('template/')[-1]
-        self.referenceError = 'Alarms_and_events.xlsx'
-        self.dirs = { 'inputDir': './input', 'outputDir': './output', 'logDir': './log' }
-        self.checks = (('Check active Alarms', 'alt', 
-                        r'(?si)Date & Time \(Local\) +S +Specific Problem +MO \(Cause/AdditionalInfo\)\n'
-                        r'={10,}\n'
-                        r'(.*?)\n?'
-                        r'>>> Total: \d+ Alarms \(\d+ Critical, \d+ Major\)',
-                        r'20\d{2}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} (\w) ((?:\w+ ?)+) +(.*)', 'Alarms_and_events.xlsx'),
-                       ('Check Event and System Logs', 'lgesmr 7d',
-                        r'(?si)Timestamp \(UTC\) +Type +Merged Log Entry\n'
-                        r'={10,}\n'
-                        r'(.*)', r'(?i)[\d-]+ [\d:]+ +\w+ +(?:(?:(?:\w+=[\w-]+),)+(\w+=[\w-]+)|(?:Crash on (\d+), '
-                                 r'device=(\d+) \w+)) +(.+)', ''),
-                       ('Check Node Restart and System Downtime', 'lgd',
-                        r'(?si)Timestamp \(UTC\) +RestartType/Reason +Configuration Version +SwRelease +CPP Downtime +'
-                        r'Appl. Downtime +JVM Downtime\n'
-                        r'={10,}\n'
-                        r'(.+)\n+'
-                        r'Node uptime since last restart: \d+ \w+ \((?:(\d+) days)?,? ?(?:(\d+) hours)?',
-                        r'(?i)(\d{4})-(\d{2})-(\d{2}) [\d:]+ Spontaneous', ''),
-                       ('Check Date and Time Synchronization', 'lh coremp readclock',
-                        r'(?si)\d{6}-\d{2}:\d{2}:\d{2} [\w \d./=]+\n(.+)',
-                        r'\$ lhsh 00\d{2}00 readclock\n\d+: Date: 20(\d{2})-(\d{2})-(\d{2})', ''),
-                       ('Check Network Synchronization', ('get Synchronization=1', 'st tusync'), 'EXCEPTION', '', ''),
-                       ('Check the M3UA Associations', 'st m3ua',
-                        '(?si)Proxy +Adm State +Op. +State +MO\n={10,}\n'
-                        '(.*?)={10,}\n'
-                        'Total: \d+ MOs',
-                        r'(?i) +\d+ +\d+ \(DISABLED\) +(?:[\w\d]+=[\w\d]+,)*M3uAssociation=(\w{2})[\d\w]+', ''),
-                       ('Check RNC CC, DC and PDR devices', 'std',
-                        '(?i)-{10,}\nType +%Up +Total +Enabled\(1\) +Disabled\(0\) +Locked\(L\) +Active\(A\) +'
-                        'Idle\(I\) +Busy\(B\) +Unallocated\n-{10,}\n'
-                        '((?:\w+ +\d+% +\d+ +\d+ +\d+ +\d+ +\d+ +\d+ +\d+ +\d+\n)+)-{10,}\n'
-                        'TOT +\d+% +\d+ +\d+ +\d+ +\d+ +\d+ +\d+ +\d+ +\d',
-                        '(?i)(\w+) +(\d+)% +(\d+) +(\d+) +(\d+) +(\d+) +(\d+) +(\d+) +(\d+) +(\d+)', ''),
-                       ('Check IubLink and Utrancell resource Status', 'strt',
-                        r'(?si)Following \d+ sites are up:.*'
-                        r'Following \d+ sites are totally or partially unavailable:.*-{10,}\n+'
-                        r'(.*)',
-                        r'([\w ]+): +(\d+) of +(\d+) [\w ]+\(([\d.]+) %\)', ''),
-                       ('Check RANAP and Iu link', 'st ranap',
-                        '(?si)Proxy +Adm +State +Op. State +MO\n'
-                        '={10,}\n'
-                        '(.*?)={10,}\n'
-                        'Total: \d+ MOs', '(?si) *\d+ +[\d\w]+ \(DISABLED\) +((?:[\w\d_]+=[\w\d_]+,?)+)', ''),
-                       ("Check CV's stored on RNC", 'cvls',
-                        r"(?i)>>> Total: (\d+ CV's, \d+ UP's)", "(?i)(\d+)[\w', ]+(\d+)", ''),
-                       ('Check CV Database inconsistency', 'dbc',
-                        '(?is)={10,}\nDatabase Consistency Check.*?\n={10,}\n(.*?)\n?Conclusion: the database is [\w ]+',
-                        '(?i) *(.*(YES|NO))', ''),
-                       ('Current software level', 'cvcu',
-                        '(?i)((?:[\w+ ]+: +[\w%=/]+ +[\w/]+ +W[\d.]+ \([\w\d.-]+\)\n|-{10,}\n)+)',
-                        '[\w+ ]+: +[\w%=/]+ +[\w/]+ +W([\d.]+) \([\w\d.-]+\)', ''),
-                       ('Check ethernet connectivity (i.e. Internal_IP_Transport Vlan)', ('steg', 'stip'), 'EXCEPTION',
-                        'EXCEPTION', ''),
-                       ('Check CC/DC/PDR allocation', ('lh cenmp drhcendh cc', 'lh cenmp drhcendh dc',
-                                                       'lh cenmp drhcendh pdr'),
-                        'EXCEPTION', 'EXCEPTION', ''),
-                       ('Check for disable Mos', 'st all 1\.\*0', '(?is)Proxy +Adm +State +Op. +State +MO\n={10,}\n'
-                                                                  '(.*?)\n?={10,}\nTotal: \d+ MOs', '(.+)', ''),
-                       ('Health check result', 'get ManagedElement=1 healthCheckResult\|healthCheckSchedule',
-                        r'(?si)={10,}\n'
-                        r'MO +Attribute +Value\n={10,}\n'
-                        r'(.*?)\n?'
-                        r'={10,}\n'
-                        r'Total: \d+ Mos',
-                        r'(?i)ManagedElement=\d+ +healthCheckResult Struct\{\d\}.*\n?'
-                        r'(?: >>> 1.healthCheckResultCode = (\d+ \(\w+\)).*)?\n?'
-                        r'(?: >>> 2.message = (.*))?\n?'
-                        r'(?: >>> 3.startTime = [\d-]+ [\d:]+)?', ''),
-                       ('Health check scheduler', 'get ManagedElement=1 healthCheckResult\|healthCheckSchedule',
-                        r'(?si)={10,}\n'
-                        r'MO +Attribute +Value\n={10,}\n'
-                        r'(.*?)\n?'
-                        r'={10,}\n'
-                        r'Total: \d+ Mos',
-                        r'ManagedElement=\d+ +healthCheckSchedule t\[(\d+)\].*\n?'
-                        r'(?: >>> Struct\[\d\] +has \d+.*)?\n?'
-                        r'(?: >>> 1[.]time = \d{2}:\d{2})?\n?'
-                        r'(?: >>> 2[.]weekday = \d+ \(\w+\))?', ''),
-                       ('Check repartition of IubLinks and Cells', 'lkra',
-                        '(?is)Sr +Mod +S +GPB +nIub +CellGPB +CellCC +nCC\n-{10,}\n'
-                        '(.*?)\n?-{10,}\n+Cell repartition by Board:',
-                        '(?i)\w+ +(?P<mod>\d+) +\d+ +\w+ +(?P<niub>\d+).*', ''),
-                       ('Check main KPI', 'pmr -m 12 -r 1', '(?si)Object Counter *\n(.+)',
-                        '(?i) +(?P<name>\w+) +(?P<value>[\w/.]+)', ''),
-                       ('Check redundancy state',
-                        ('lh coremp mirror stat', 'st SwitchInternalLink', 'get SwitchCoreUnit state'),
-                        'EXCEPTION', 'EXCEPTION', ''))
-        self.output = []
-        self.wb = None
-        self.log = None
-        self.alarms = None
-        self.alarmsReferenceName = ''
-        self.logdate = None
-        if not os.path.exists(self.dirs['inputDir']):
-            os.mkdir(self.dirs['inputDir'])
-        if not os.path.exists(self.dirs['outputDir']):
-            os.mkdir(self.dirs['outputDir'])
-        if not os.path.exists(self.dirs['logDir']):
-            os.mkdir(self.dirs['logDir'])
+PLACEHOLDER_RE = re.compile(r'v<#(\w+)#>')
+FORMULA_RE = re.compile(r'f<#(.*)#>')
+
+
+def render(row, values):
+    """Values of the template row with the placeholders v<#Name#> replaced by values[Name] and
+    the formulae f<#...#> unwrapped. Unknown placeholders are left as they are."""
+    def replace(m):
+        value = values.get(m.group(1), m.group(0))
+        return value if value is not None else ''
+    rendered = []
+    for value in row:
+        if isinstance(value, str):
+            value = PLACEHOLDER_RE.sub(replace, value)
+            if FORMULA_RE.search(value):
+                value = FORMULA_RE.sub(r'\1', value).replace(';', ',')
+        rendered.append(value)
+    return rendered
+
+
+def copy_worksheet(self, from_worksheet, title=None):
+    """Copies the worksheet into the workbook in memory: values, styles and formulae of its cells,
+    row and column dimensions, merged cells and page layout.
+    copy.copy of a worksheet shares the cells with the original, and openpyxl 2.3 has no copy_worksheet yet.
+    :param self: itself
+    :param from_worksheet: Worksheet of the workbook to copy.
+    :param title: Title of the copy.
+    Usage:
+    * ws = wb.copy_worksheet(wb['Controller log template'], 'RNC01.log')
+    """
+    ws = self.create_sheet(title=title or from_worksheet.title + ' Copy')
+    for (row, col), source in from_worksheet._cells.items():
+        cell = ws.cell(row=row, column=col)
+        cell._value = source._value
+        cell.data_type = source.data_type
+        if source.has_style:
+            cell._style = StyleArray(source._style)
+        if source.hyperlink:
+            cell.hyperlink = source.hyperlink.target
+        if source.comment:
+            cell.comment = Comment(source.comment.text, source.comment.author)
+    for attr in ('row_dimensions', 'column_dimensions'):
+        dimensions = getattr(ws, attr)
+        for key, dim in getattr(from_worksheet, attr).items():
+            dim = copy.copy(dim)
+            dim.parent = ws
+            if dim.has_style:
+                dim._style = StyleArray(dim._style)
+            dimensions[key] = dim
+    ws.formula_attributes = copy.deepcopy(from_worksheet.formula_attributes)
+    ws._merged_cells = list(from_worksheet._merged_cells)
+    for attr in ('sheet_properties', 'sheet_view', 'sheet_state', 'page_margins', 'print_options', 'paper_size',
+                 'orientation', 'header_footer', 'protection', 'page_breaks', '_auto_filter', '_freeze_panes',
+                 'conditional_formatting'):
+        setattr(ws, attr, copy.deepcopy(getattr(from_worksheet, attr)))
+    ws.page_setup = copy.copy(from_worksheet.page_setup)
+    ws.page_setup._parent = ws
+    return ws
+
+
+class ZbCommandIndex():
+    """Index of the log: command -> its output blocks (timestamp line included)
+
+    The log is split at the prompt lines ('<node>> <command>') found by promptRE, which has neither
+    lookaheads nor nested quantifiers, so indexing is linear in the log size whatever the output is.
+    promptRE starts with a line break to let the regex engine skip quickly to the next line.
+    The log is either a str or a bytes-like object (e.g. mmap of the log file). Only the offsets of the
+    blocks are kept, a block is sliced and decoded when a check asks for it.
+    """
+    promptRE = re.compile(r'\n[\w\d.]+>')
+    promptBytesRE = re.compile(rb'\n[\w\d.]+>')
+
+    def __init__(self, log, commands=None, encoding=None, start=0, end=None):
+        """
+        :param log: text of the log, str or bytes-like
+        :param commands: commands to index, the blocks of the others are skipped; None - all of them
+        :param encoding: encoding of a bytes-like log
+        :param start, end: the log is log[start:end] (e.g. the section of a node in a session log), indexed
+        in place, without a copy
+        """
+        super(ZbCommandIndex, self).__init__()
+        self.log = log
+        self.binary = not isinstance(log, str)
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.start = start
+        self.end = len(log) if end is None else end
+        self.blocks = []
+        self.commands = {}
+        # Size of the whole log, fromstream keeps only a part of it
+        self.size = self.end - start
+        promptRE, newline, space, cr = ((self.promptBytesRE, b'\n', b' ', b'\r') if self.binary else
+                                        (self.promptRE, '\n', ' ', '\r'))
+        prompts = [(prompt.start() + 1, prompt.end()) for prompt in promptRE.finditer(log, start, self.end)]
+        first = promptRE.match(newline + log[start:min(start + 256, self.end)])
+        if first:
+            prompts.insert(0, (start, start + first.end() - 1))
+        prompts.append((self.end + 1, None))
+        # The blocks of the other commands are skipped by their prompt line, before decoding anything
+        wanted = None if commands is None else set(
+            command.encode(self.encoding) if self.binary else command for command in commands)
+        for num, (_, promptEnd) in enumerate(prompts[:-1]):
+            lineEnd = log.find(newline, promptEnd, self.end)
+            if lineEnd < 0 or log[promptEnd:promptEnd + 1] != space:
+                continue
+            line = log[promptEnd + 1:lineEnd]
+            # A log with Windows line breaks keeps the carriage return at the end of the prompt line
+            if line[-1:] == cr:
+                line = line[:-1]
+            if wanted is not None and line not in wanted:
+                continue
+            command = self.decode(line)
+            # The output ends with the line break before the next prompt
+            self.blocks.append((lineEnd + 1, prompts[num + 1][0] - 1))
+            self.commands.setdefault(command, []).append(len(self.blocks) - 1)
+
+    @classmethod
+    def fromstream(cls, f, commands=None, encoding=None, chunkSize=1024 * 1024):
+        """Index of the log read from the binary stream f (e.g. a decompressing one), nothing is written to disk.
+        The stream is read by chunks and only the blocks of the commands and the lines before the first prompt are
+        kept in memory; of the other blocks only their prompt line and 'Logging to file' lines are kept."""
+        promptRE = cls.promptBytesRE
+        wanted = None if commands is None else set(
+            command.encode(encoding or locale.getpreferredencoding(False)) for command in commands)
+        kept = []
+        keep = True
+        size = 0
+        # The leading line break lets promptRE find a prompt on the first line, it is dropped at the end
+        tail = b'\n'
+        while True:
+            chunk = f.read(chunkSize)
+            size += len(chunk)
+            data = tail + chunk
+            pos = 0
+            end = len(data)
+            for prompt in promptRE.finditer(data):
+                lineEnd = data.find(b'\n', prompt.end())
+                if lineEnd < 0 and chunk:
+                    # The prompt line is completed by the next chunk
+                    end = prompt.start()
+                    break
+                cls.keep_block(kept, keep, data, pos, prompt.start())
+                # The line break before the prompt
+                kept.append(b'\n')
+                pos = prompt.start() + 1
+                line = data[prompt.end() + 1:lineEnd] if data[prompt.end():prompt.end() + 1] == b' ' else None
+                if line is not None and line[-1:] == b'\r':
+                    line = line[:-1]
+                keep = line is not None and lineEnd >= 0 and (wanted is None or line in wanted)
+                if not keep:
+                    lineEnd = lineEnd if lineEnd >= 0 else end
+                    kept.append(data[pos:lineEnd])
+                    pos = lineEnd
+            else:
+                if chunk:
+                    # A prompt may start at the last line break and go on in the next chunk
+                    lineStart = data.rfind(b'\n', pos)
+                    end = lineStart if lineStart >= 0 else end
+            cls.keep_block(kept, keep, data, pos, end)
+            tail = data[end:]
+            if not chunk:
+                break
+        index = cls(b''.join(kept)[1:], commands, encoding)
+        index.size = size
+        return index
+
+    @staticmethod
+    def keep_block(kept, keep, data, start, end):
+        """Adds data[start:end] of a block to kept, only the 'Logging to file' lines of a block skipped"""
+        if keep:
+            kept.append(data[start:end])
+            return
+        for session in SESSION_RE.finditer(data, start, end):
+            kept.append(b'\n' + session.group(0))
+
+    @classmethod
+    def mapfile(cls, f, commands=None, encoding=None, start=0, end=None):
+        """Index of the log file opened in binary mode, the file is memory-mapped instead of being read;
+        start and end bound the log in the file (see __init__)"""
+        import mmap
+        if os.fstat(f.fileno()).st_size == 0:
+            return cls(b'', commands, encoding)
+        return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), commands, encoding, start, end)
+
+    def close(self):
+        # Only a memory-mapped log (see mapfile) has to be closed
+        if hasattr(self.log, 'close'):
+            self.log.close()
+
+    def decode(self, text):
+        if self.binary:
+            text = text.decode(self.encoding)
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
+
+    def search(self, pattern):
+        """Groups of the first match of the regex over the whole log, None if not found"""
+        match = re.compile(pattern.encode('ascii') if self.binary else pattern).search(self.log, self.start, self.end)
+        return tuple(self.decode(g) if g is not None else None for g in match.groups()) if match else None
+
+    def find(self, command):
+        """Output blocks of the command (or tuple of commands) in log order"""
+        commands = command if isinstance(command, tuple) else (command,)
+        return [self.decode(self.log[self.blocks[num][0]:self.blocks[num][1]])
+                for num in sorted(num for c in commands for num in self.commands.get(c, ()))]
+
+
+class ZbFixedWidthTable():
+    """Column-aligned table of a command output (steg, stip)
+
+    The column boundaries are found once from the header line: every header word starts a column, a column
+    named by several words ('Op. State') ends where the next header word starts, the last one runs to the end
+    of the line. The rows are then cut by slices, without a regex per row, so a row may have empty fields.
+    The std and lkra tables are not parsed so: they have no empty fields but their numbers are not always under
+    their header word, their rows are split on blanks. The strt output is summary lines, not a table.
+    """
+
+    def __init__(self, header, names):
+        """
+        :param header: header line of the table, the rows are aligned with it
+        :param names: names of the columns to read, in header order, case-insensitive
+        """
+        super(ZbFixedWidthTable, self).__init__()
+        header = header.rstrip('\n').lower()
+        starts = [i for i, c in enumerate(header) if c != ' ' and (i == 0 or header[i - 1] == ' ')]
+        index = {start: num for num, start in enumerate(starts)}
+        slices = []
+        pos = 0
+        for name in names:
+            name = name.lower()
+            pos = header.find(name, pos)
+            while pos >= 0 and (pos not in index or header[pos + len(name):pos + len(name) + 1] not in ('', ' ')):
+                pos = header.find(name, pos + 1)
+            if pos < 0:
+                raise ValueError('No column %r in the header %r' % (name, header))
+            num = index[pos]
+            end = num + 1
+            while end < len(starts) and starts[end] < pos + len(name):
+                end += 1
+            slices.append(slice(starts[num], starts[end] if end < len(starts) else None))
+            pos += len(name)
+        self.slices = tuple(slices)
+        # The rows too short to reach the last column read are not rows of the table
+        self.width = slices[-1].start if slices else 0
+
+    def rows(self, text):
+        """Rows of the text as tuples of the fields in the order of the names, stripped and lowercased"""
+        slices = self.slices
+        width = self.width
+        for line in text.lower().split('\n'):
+            if len(line) >= width and line:
+                yield tuple(line[column].strip() for column in slices)
+
+
+ZbMoState = collections.namedtuple('ZbMoState', 'proxy adm op ldn')
+
+
+class ZbMoStateTable():
+    """States of the MOs of a node from the 'Proxy  Adm State  Op. State  MO' tables of st outputs
+
+    A table is built from the outputs of the st commands of a check, once per node (see ZbAnalyser.mo_states),
+    and the check queries it by MO class (the class of the last RDN of the LDN). A MO listed by
+    several outputs is kept once, with its state from the last output.
+    The states are lowercase names ('unlocked', 'disabled'), '' if the MO has no such state.
+    """
+    blockRE = re.compile(r'(?si)Proxy +Adm +State +Op. +State +MO\n={10,}\n(.*?)\n?={10,}\nTotal: \d+ MOs')
+    opStates = ('enabled', 'disabled')
+
+    def __init__(self, outputs=()):
+        super(ZbMoStateTable, self).__init__()
+        self.mos = {}
+        self.classes = {}
+        for output in outputs:
+            self.add(output)
+
+    def add(self, output):
+        """Adds the MOs of an output block of a st command"""
+        for block in self.blockRE.findall(output):
+            for line in block.split('\n'):
+                parts = line.split()
+                if not parts or not parts[0].isdigit():
+                    continue
+                states = []
+                num = 1
+                while num + 1 < len(parts) and parts[num + 1][:1] == '(' and parts[num + 1][-1:] == ')':
+                    states.append(parts[num + 1][1:-1].lower())
+                    num += 2
+                if len(states) == 1:
+                    states = ['', states[0]] if states[0] in self.opStates else [states[0], '']
+                elif not states:
+                    states = ['', '']
+                ldn = ' '.join(parts[num:])
+                if ldn not in self.mos:
+                    mocls = ldn.rpartition(',')[2].partition('=')[0].lower()
+                    self.classes.setdefault(mocls, []).append(ldn)
+                self.mos[ldn] = ZbMoState(int(parts[0]), states[0], states[-1], ldn)
+
+    def find(self, *classes):
+        """MOs of the classes (case-insensitive) in the order they were listed"""
+        return [self.mos[ldn] for mocls in classes for ldn in self.classes.get(mocls.lower(), ())]
+
+    def select(self, adm=None, op=None):
+        """MOs of all classes with the admin and operational states given (None - any)"""
+        return [mo for mo in self.mos.values() if (adm is None or mo.adm == adm) and (op is None or mo.op == op)]
+
+    def __len__(self):
+        return len(self.mos)
 
-    def init_alarms(self):
-        wb = openpyxl.load_workbook(filename=self.referenceError)
-        ws = wb['Alarms']
-        self.alarms = []
-        headerfounded = False
-        for row in ws.iter_rows():
-            if headerfounded:
-                b = []
-                for cell in row:
-                    if cell.column in ('A', 'B', 'C', 'D', 'E', 'F'):
-                        b.append(cell.value.strip(' '))
-                if b[0] is not None:
-                    self.alarms.append(tuple(b))
-            if row[0].value and row[0].value.lower().strip(' ') == 'specificproblem':
-                headerfounded = True
-        self.alarms = tuple(self.alarms)
-        return self.alarms
 
-    def check5(self, nextStr, output):
-        outputLinesRE = re.compile(r'(?is)211 +TransportNetwork=1,Synchronization=1\n={10,}\n(.*?)\n?={10,}')
-        if outputLinesRE.search(output):
-            for outputLines in outputLinesRE.findall(output):
-                synx = {k.lower(): v for k, v in re.findall(r'((?: >>> )?\w+) +(.*)', outputLines)}
-                if (synx['syncrefstatus'].lower().find('ok') < 0 or
-                    int(re.search('\[(\d+)\]', synx['syncreference']).group(1)) < 2):
+COMMAND_DATE_RE = re.compile(r'(\d{6})-\d{2}:\d{2}:\d{2}')
+# Compressed logs of the input directory: extension -> module opening the file as a decompressing binary stream
+# (see compressed_opener), imported only when such a log is read
+COMPRESSED = {'.gz': 'gzip', '.xz': 'lzma', '.bz2': 'bz2'}
+PATTERN_TYPE = type(COMMAND_DATE_RE)
+
+
+def compressed_opener(path):
+    """open function of the compression module of the file (see COMPRESSED), None if the file is not compressed"""
+    module = COMPRESSED.get(os.path.splitext(path)[1].lower())
+    return importlib.import_module(module).open if module else None
+# Header of a moshell session of a node: a session log of several nodes has one before the commands of each node
+SESSION_RE = re.compile(rb'(?m)^Logging to file ([^\r\n]*)')
+
+
+class ZbCountingPattern():
+    """Compiled regex that adds the number of its matches to owner.matches, the rest is delegated to the regex"""
+    def __init__(self, pattern, owner):
+        self.pattern = pattern
+        self.owner = owner
+
+    def __getattr__(self, name):
+        return getattr(self.pattern, name)
+
+    def search(self, *args, **kwargs):
+        match = self.pattern.search(*args, **kwargs)
+        self.owner.matches += match is not None
+        return match
+
+    def match(self, *args, **kwargs):
+        match = self.pattern.match(*args, **kwargs)
+        self.owner.matches += match is not None
+        return match
+
+    def findall(self, *args, **kwargs):
+        matches = self.pattern.findall(*args, **kwargs)
+        self.owner.matches += len(matches)
+        return matches
+
+    def finditer(self, *args, **kwargs):
+        for match in self.pattern.finditer(*args, **kwargs):
+            self.owner.matches += 1
+            yield match
+
+
+class ZbHistory():
+    """History of the values of the checks (ZbCheckRow.values) in sqlite: node, name, log date -> value.
+    The primary key (node, name, log date) serves the series of a node, the index (name, log date) the queries
+    over all the nodes, the table nodes the last values of every node. Log dates are 'YYYY-MM-DD', so they
+    compare as strings.
+    """
+    def __init__(self, path):
+        super(ZbHistory, self).__init__()
+        self.path = path
+        self.db = None
+
+    def connect(self):
+        if self.db is None:
+            import sqlite3
+            self.db = sqlite3.connect(self.path)
+            self.db.execute('CREATE TABLE IF NOT EXISTS history (node TEXT NOT NULL, name TEXT NOT NULL, '
+                            'logdate TEXT NOT NULL, value, PRIMARY KEY (node, name, logdate)) WITHOUT ROWID')
+            self.db.execute('CREATE INDEX IF NOT EXISTS history_name ON history (name, logdate)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS nodes (node TEXT PRIMARY KEY) WITHOUT ROWID')
+        return self.db
+
+    def add(self, node, logdate, values):
+        """Stores the values (name -> number or text) of the node, the values of the same log date are replaced"""
+        self.connect().execute('INSERT OR IGNORE INTO nodes VALUES (?)', (node,))
+        self.db.executemany('INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?)',
+                            ((node, name, logdate, value) for name, value in values.items()))
+
+    def series(self, node, name, since=None):
+        """(log date, value) of the node from the log date since (all if None) on, e.g.
+        series('RNC01.log', 'psdrop', '2016-10-01')"""
+        return self.connect().execute('SELECT logdate, value FROM history WHERE node = ? AND name = ? AND logdate >= ? '
+                                      'ORDER BY logdate', (node, name, since or '')).fetchall()
+
+    def latest(self, name, until=None):
+        """node -> (log date, value) of the last value of every node up to the log date until (all if None)"""
+        rows = self.connect().execute(
+            'SELECT node, logdate, (SELECT value FROM history h WHERE h.node = l.node AND h.name = :name '
+            'AND h.logdate = l.logdate) FROM (SELECT node, (SELECT MAX(m.logdate) FROM history m '
+            'WHERE m.node = n.node AND m.name = :name AND m.logdate <= :until) AS logdate FROM nodes n) l '
+            'WHERE logdate IS NOT NULL', {'name': name, 'until': until or '9999'}).fetchall()
+        return {node: (logdate, value) for node, logdate, value in rows}
+
+    def risen(self, name, since):
+        """(node, value before, value now) of the nodes whose last value is greater than the last one up to
+        the log date since, e.g. risen('alarmsCritical', yesterday)"""
+        # Only the values after since are scanned (by the index), the values before are looked up by the key
+        return self.connect().execute(
+            'SELECT node, before, value FROM (SELECT h.node, h.value, '
+            '(SELECT p.value FROM history p WHERE p.node = h.node AND p.name = h.name AND p.logdate <= :since '
+            'ORDER BY p.logdate DESC LIMIT 1) AS before FROM history h '
+            'WHERE h.name = :name AND h.logdate > :since AND h.logdate = '
+            '(SELECT MAX(m.logdate) FROM history m WHERE m.node = h.node AND m.name = h.name)) '
+            'WHERE value > before ORDER BY node', {'name': name, 'since': since}).fetchall()
+
+    def close(self):
+        if self.db is not None:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+
+class ZbThresholdRules():
+    """Limits of counters by severity: rules (counter, direction, {Severity: limit}), direction 'min' - the value
+    fails the limit if it is not above it, 'max' - if it is not below it. N/A values fail nothing.
+    grade evaluates the rules for many nodes at once, column by column: each counter of all the nodes is one
+    array of floats (NaN for N/A), every limit is one pass over it.
+    """
+    # 'PSAccess|SpchAccess ≥90' of Criteria.xlsx: the counters and the limit they should keep to
+    ruleRE = re.compile(r'([\w|]+) *(≥|≤|>=|<=) *(\d+(?:[.,]\d+)?)')
+
+    def __init__(self, rules):
+        super(ZbThresholdRules, self).__init__()
+        self.rules = tuple(rules)
+
+    def counters(self):
+        return sorted(set(counter for counter, direction, limits in self.rules))
+
+    @classmethod
+    def fromxlsx(cls, filename, caption):
+        """Rules of the check caption from the criteria workbook (Criteria.xlsx): the row of the check and the rows
+        below it up to the next check, the columns of the severities are found by their names in the header.
+        The criteria are written as the values the counters should keep to, e.g. 'SpchDrop|PSDrop ≤4' in the column
+        of CRITICAL: SpchDrop and PSDrop from 4 on are critical. None if the check has no such criteria."""
+        ws = load_openpyxl().load_workbook(filename=filename, read_only=True).worksheets[0]
+        rows = [[cell.value for cell in row] for row in ws.rows]
+        columns = {num: severity for num, title in enumerate(rows[0]) for severity in Severity
+                   if severity != Severity.Ok and isinstance(title, str) and severity.name.upper() in title.upper()}
+        limits = collections.OrderedDict()
+        found = False
+        for row in rows[1:]:
+            if row[0] is not None:
+                if found:
+                    break
+                found = str(row[0]).strip() == caption
+            if not found:
+                continue
+            for num, severity in columns.items():
+                for counters, sign, limit in cls.ruleRE.findall(str(row[num] or '')):
+                    for counter in counters.lower().split('|'):
+                        direction = 'min' if sign in ('≥', '>=') else 'max'
+                        limits.setdefault((counter, direction), {})[severity] = float(limit.replace(',', '.'))
+        return cls((counter, direction, severities) for (counter, direction), severities in limits.items()) \
+            if limits else None
+
+    def grade(self, columns, count):
+        """Severities of count nodes by columns: counter -> values of the nodes (numbers, None or text if N/A)"""
+        codes = array('B', [Severity.Ok.value[0]]) * count
+        arrays = {counter: array('d', (value if isinstance(value, (int, float)) else float('nan')
+                                       for value in columns[counter]))
+                  for counter in self.counters() if counter in columns}
+        # From the mildest severity to the worst one, so the worst failed limit is the last one written
+        for severity in sorted(Severity, key=lambda severity: -severity.value[0]):
+            for counter, direction, limits in self.rules:
+                if severity not in limits or counter not in arrays:
+                    continue
+                limit = limits[severity]
+                failed = ((value <= limit for value in arrays[counter]) if direction == 'min' else
+                          (value >= limit for value in arrays[counter]))
+                for num in itertools.compress(range(count), failed):
+                    codes[num] = severity.value[0]
+        return [ZbResultTable.severities[code] for code in codes]
+
+    def grade_history(self, history, until=None):
+        """node -> Severity by the last values of the counters of the nodes in ZbHistory up to the log date until,
+        the logs are not read again"""
+        latest = {counter: history.latest(counter, until) for counter in self.counters()}
+        nodes = sorted(set(node for values in latest.values() for node in values))
+        columns = {counter: [values[node][1] if node in values else None for node in nodes]
+                   for counter, values in latest.items()}
+        return collections.OrderedDict(zip(nodes, self.grade(columns, len(nodes))))
+
+
+class ZbStats():
+    """Instrumentation of a run: JSON lines in the log directory, file run-<run>.jsonl.
+    Every record has the fields record ('check', 'node' or 'run'), run, node and check:
+    check - wall time, bytes scanned, output blocks and regex matches (if counted) of a check on a node;
+    node - time of indexing, checking and of openpyxl spent on the sheets of a node;
+    run - number of nodes, wall time and openpyxl time of loading and saving the report.
+    """
+    def __init__(self, logDir):
+        super(ZbStats, self).__init__()
+        self.run = '%s-%d' % (datetime.datetime.now().strftime('%y%m%d-%H%M%S'), os.getpid())
+        self.path = os.path.join(logDir, 'run-%s.jsonl' % self.run)
+        self.profilePath = os.path.join(logDir, 'run-%s.prof' % self.run)
+        self.file = None
+
+    def write(self, record, node=None, check=None, **fields):
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.file = open(self.path, 'a', encoding='utf-8')
+        fields.update(record=record, run=self.run, node=node, check=check)
+        self.file.write(json.dumps(fields, sort_keys=True) + '\n')
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+CHECKS = collections.OrderedDict()
+
+
+def register(cls):
+    """Class decorator: adds an instance of the check to the registry CHECKS (caption -> check).
+    The report rows follow the order of registration, to disable a check just drop the decorator.
+    """
+    CHECKS[cls.caption] = cls()
+    return cls
+
+
+class ZbCheck():
+    """Check of the log: caption of the report row, command (or tuple of commands) whose output is checked
+    and the patterns of that output. The patterns are compiled once, when the class is defined:
+    outputRE finds the useful part of an output block (group 1), elementRE the elements of that part.
+    """
+    caption = ''
+    command = ''
+    # The worst severity the check can report (see ZbAnalyser.select_checks)
+    severity = Severity.Critical
+    outputRE = None
+    elementRE = None
+    alarmsReference = ''
+    # The check reads the MO states of the node (see evaluate_states) rather than its st outputs
+    states = False
+    instrumented = False
+    matches = 0
+
+    def commands(self):
+        """Commands of the check as a tuple"""
+        return self.command if isinstance(self.command, tuple) else (self.command,)
+
+    def instrument(self):
+        """Counts the matches of the patterns of the check in self.matches"""
+        if not self.instrumented:
+            self.instrumented = True
+            for name in dir(self):
+                if isinstance(getattr(self, name), PATTERN_TYPE):
+                    setattr(self, name, self.counted(getattr(self, name)))
+
+    def counted(self, pattern):
+        """The pattern counting its matches if the check is instrumented"""
+        return ZbCountingPattern(pattern, self) if self.instrumented else pattern
+
+    def evaluate(self, analyser, nextStr, output):
+        """Updates the report row nextStr by one output block of the command"""
+        if self.outputRE is None:
+            return nextStr
+        outputLinesRE = self.outputRE.search(output)
+        if outputLinesRE is None:
+            print('%s - outputLinesRE is fail!' % nextStr.CheckName)
+            return nextStr
+        return self.evaluate_lines(analyser, nextStr, outputLinesRE)
+
+    def evaluate_lines(self, analyser, nextStr, outputLinesRE):
+        """Updates the report row nextStr by the match of outputRE"""
+        return nextStr
+
+    def evaluate_states(self, analyser, nextStr, states):
+        """Updates the report row nextStr by the MO states of the node (ZbMoStateTable), once after
+        the output blocks"""
+        return nextStr
+
+
+@register
+class ZbAlarmsCheck(ZbCheck):
+    caption = 'Check active Alarms'
+    command = 'alt'
+    outputRE = re.compile(r'(?si)Date & Time \(Local\) +S +Specific Problem +MO \(Cause/AdditionalInfo\)\n'
+                          r'={10,}\n'
+                          r'(.*?)\n?'
+                          r'>>> Total: \d+ Alarms \(\d+ Critical, \d+ Major\)')
+    elementRE = re.compile(r'20\d{2}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} (\w) ((?:\w+ ?)+) +(.*)')
+    alarmsReference = 'Alarms_and_events.xlsx'
+
+    def evaluate_lines(self, analyser, nextStr, outputLinesRE):
+        for element in self.elementRE.findall(outputLinesRE.group(1)):
+            if analyser.alarmsReferenceName == self.alarmsReference and analyser.alarms is not None:
+                severity = analyser.alarmsIndex.get(element[1].lower().strip(' '))
+                if severity is None:
+                    continue
+                if element[0] == 'c' and severity == 'critical':
+                    nextStr.alarmsCritical += 1
+                    nextStr.alarmsDetail.append(element[1])
+                elif element[0] == 'M' and severity == 'major':
+                    nextStr.alarmsMajor += 1
+                    nextStr.alarmsDetail.append(element[1])
+                elif element[0] == 'm' and severity == 'minor':
+                    nextStr.alarmsMinor += 1
+                elif element[0] == 'w' and severity == 'warning':
+                    nextStr.alarmsWarning += 1
+                else:
+                    nextStr.alarmsCollision += 1
+                    print('%s - Unknown perceivedSeverity!' % nextStr.CheckName)
+        nextStr.alarmsTotal = nextStr.alarmsCritical + nextStr.alarmsMajor + nextStr.alarmsMinor + \
+                              nextStr.alarmsWarning + nextStr.alarmsCollision
+        nextStr.values.update((counter, getattr(nextStr, counter)) for counter in ZbResultTable.counters)
+        if nextStr.alarmsTotal > 0:
+            nextStr.Observation = ('\n' if nextStr.Observation != '' else '') + 'Total %d alarms:' % \
+                                                                                nextStr.alarmsTotal
+            comma = False
+            if nextStr.alarmsCritical > 0:
+                nextStr.Observation += ' %d critical' % nextStr.alarmsCritical
+                comma = True
+                nextStr.Severity = Severity.Critical
+            if nextStr.alarmsMajor > 0:
+                nextStr.Observation += (',' if comma else '') + ' %d major' % nextStr.alarmsMajor
+                comma = True
+                if nextStr.Severity.value[0] > Severity.Major.value[0]:
+                    nextStr.Severity = Severity.Major
+            if nextStr.alarmsMinor > 0:
+                nextStr.Observation += (',' if comma else '') + ' %d minor' % nextStr.alarmsMinor
+                comma = True
+                if nextStr.Severity.value[0] > Severity.Minor.value[0]:
+                    nextStr.Severity = Severity.Minor
+            if nextStr.alarmsWarning > 0:
+                nextStr.Observation += (',' if comma else '') + ' %d warning' % nextStr.alarmsWarning
+                comma = True
+                if nextStr.Severity.value[0] > Severity.Warning.value[0]:
+                    nextStr.Severity = Severity.Warning
+        return nextStr
+
+
+EventRecord = collections.namedtuple('EventRecord', 'timestamp mo crash device text')
+
+
+@register
+class ZbEventLogCheck(ZbCheck):
+    caption = 'Check Event and System Logs'
+    command = 'lgesmr 7d'
+    outputRE = re.compile(r'(?si)Timestamp \(UTC\) +Type +Merged Log Entry\n'
+                          r'={10,}\n'
+                          r'(.*)')
+    elementRE = re.compile(r'(?i)([\d-]+ [\d:]+) +\w+ +(?:(?:(?:\w+=[\w-]+),)+(\w+=[\w-]+)|(?:Crash on (\d+), '
+                           r'device=(\d+) \w+)) +(.+)')
+    # (signature in the lowered entry text, severity, caption of the observation)
+    signatures = (('ranap_cninitiatedresetresource', Severity.Critical, 'Ranap_CNInitiatedResetResource '),
+                  ('ipethpacketdatarouter_cnnotrespondingtogtpecho', Severity.Major,
+                   'IpEthPacketDataRouter_CnNotRespondingToGTPEcho '),
+                  ('a non-local mau has been chosen as the active client', Severity.Warning,
+                   'A Non-Local MAU Has Been Chosen as the Active Client '))
+    markers = tuple(signature for signature, severity, caption in signatures) + ('crash on',)
+
+    def records(self, outputLines):
+        """Crashes and the entries with a signature (at least) as EventRecord in log order,
+        crash is None for the entries of an MO. Most of a week of merged log on a busy node has none of them,
+        so the lowered output is scanned for the markers by str.find and only the lines found are parsed."""
+        lowered = outputLines.lower()
+        starts = set()
+        if len(lowered) == len(outputLines):
+            for marker in self.markers:
+                pos = lowered.find(marker)
+                while pos >= 0:
+                    starts.add(lowered.rfind('\n', 0, pos) + 1)
+                    pos = lowered.find('\n', pos)
+                    if pos >= 0:
+                        pos = lowered.find(marker, pos)
+        if len(lowered) != len(outputLines) or len(starts) * 4 > outputLines.count('\n'):
+            # Lowering moved the offsets of some non-ASCII text, or most of the entries are wanted anyway:
+            # parse all of them, evaluate_lines skips the ones without a signature
+            return [EventRecord(timestamp, mo, int(crash) if crash else None, device, text)
+                    for timestamp, mo, crash, device, text in self.elementRE.findall(outputLines)]
+        records = []
+        for start in sorted(starts):
+            end = outputLines.find('\n', start)
+            element = self.elementRE.search(outputLines, start, end if end >= 0 else len(outputLines))
+            if element:
+                timestamp, mo, crash, device, text = element.groups()
+                records.append(EventRecord(timestamp, mo or '', int(crash) if crash else None, device or '', text))
+        return records
+
+    def evaluate_lines(self, analyser, nextStr, outputLinesRE):
+        MOs = [set() for signature in self.signatures]
+        sums = [0] * len(self.signatures)
+        crashes, crashSum = set(), 0
+        for record in self.records(outputLinesRE.group(1)):
+            text = record.text.lower()
+            for num, (signature, severity, caption) in enumerate(self.signatures):
+                if signature in text:
+                    MOs[num].add(record.mo)
+                    sums[num] += 1
+                    if nextStr.Severity.value[0] > severity.value[0]:
+                        nextStr.Severity = severity
+            if record.crash is not None:
+                if record.crash > 1 and nextStr.Severity.value[0] > Severity.Major.value[0]:
+                    nextStr.Severity = Severity.Major
+                elif record.crash == 1 and nextStr.Severity.value[0] > Severity.Minor.value[0]:
+                    nextStr.Severity = Severity.Minor
+                crashes.add('Crash on %d, device=%s' % (record.crash, record.device))
+                crashSum += 1
+        observations = [(caption, MOs[num], sums[num]) for num, (signature, severity, caption) in enumerate(self.signatures)]
+        # The crashes go after the signatures of the core network
+        observations.insert(2, ('', crashes, crashSum))
+        for caption, MOs, sum in observations:
+            if sum != 0:
+                if nextStr.Observation != '':
+                    nextStr.Observation += '\n'
+                nextStr.Observation += '%s%s sum: %d' % (caption, str(MOs).strip('{}').replace("'",""), sum)
+        return nextStr
+
+
+@register
+class ZbRestartCheck(ZbCheck):
+    caption = 'Check Node Restart and System Downtime'
+    command = 'lgd'
+    outputRE = re.compile(r'(?si)Timestamp \(UTC\) +RestartType/Reason +Configuration Version +SwRelease +'
+                          r'CPP Downtime +Appl. Downtime +JVM Downtime\n'
+                          r'={10,}\n'
+                          r'(.+)\n+'
+                          r'Node uptime since last restart: \d+ \w+ \((?:(\d+) days)?,? ?(?:(\d+) hours)?')
+    elementRE = re.compile(r'(?i)(\d{4})-(\d{2})-(\d{2}) [\d:]+ Spontaneous')
+
+    def evaluate_lines(self, analyser, nextStr, outputLinesRE):
+        sum = 0
+        for element in self.elementRE.findall(outputLinesRE.group(1)):
+            opdate = datetime.date(int(element[0]), int(element[1]), int(element[2]))
+            repdate = datetime.date(2000 + int(nextStr.DateOf[0:2]), int(nextStr.DateOf[2:4]), int(nextStr.DateOf[4:6]))
+            if (repdate - opdate).days <= 14:
+                sum += 1
+        if sum > 1:
+            nextStr.Severity = Severity.Critical
+        if sum == 1:
+            nextStr.Severity = Severity.Major
+        nextStr.Observation = 'Node uptime since last restart: %s days, %s hours' % \
+                              (outputLinesRE.group(2), outputLinesRE.group(3))
+        nextStr.values['uptimeHours'] = int(outputLinesRE.group(2) or 0) * 24 + int(outputLinesRE.group(3) or 0)
+        return nextStr
+
+
+@register
+class ZbClockCheck(ZbCheck):
+    caption = 'Check Date and Time Synchronization'
+    command = 'lh coremp readclock'
+    severity = Severity.Minor
+    outputRE = re.compile(r'(?si)\d{6}-\d{2}:\d{2}:\d{2} [\w \d./=]+\n(.+)')
+    elementRE = re.compile(r'\$ lhsh 00\d{2}00 readclock\n\d+: Date: 20(\d{2})-(\d{2})-(\d{2})')
+
+    def evaluate_lines(self, analyser, nextStr, outputLinesRE):
+        for element in self.elementRE.findall(outputLinesRE.group(1)):
+            if element[0]+element[1]+element[2] != nextStr.DateOf and nextStr.Severity.value[0] > Severity.Minor.value[0]:
+                nextStr.Severity = Severity.Minor
+                if nextStr.Observation != '':
+                    nextStr.Observation += '\n'
+                nextStr.Observation += 'Please check NTP'
+                break
+        return nextStr
+
+
+@register
+class ZbSyncCheck(ZbCheck):
+    caption = 'Check Network Synchronization'
+    command = ('get Synchronization=1', 'st tusync')
+    states = True
+    syncRE = re.compile(r'(?is)211 +TransportNetwork=1,Synchronization=1\n={10,}\n(.*?)\n?={10,}')
+    attributeRE = re.compile(r'((?: >>> )?\w+) +(.*)')
+    referenceRE = re.compile(r'\[(\d+)\]')
+    stateRE = re.compile(r'\(([\w ]+)\)')
+    wordRE = re.compile(r'(\w+)')
+    syncReferenceRE = re.compile(r'(?i) >>> syncReference = (.+)')
+
+    def evaluate(self, analyser, nextStr, output):
+        for outputLines in self.syncRE.findall(output):
+            synx = {k.lower(): v for k, v in self.attributeRE.findall(outputLines)}
+            if (synx['syncrefstatus'].lower().find('ok') < 0 or
+                int(self.referenceRE.search(synx['syncreference']).group(1)) < 2):
+                nextStr.Severity = Severity.Critical
+            elif synx['syncrefstatus'].lower().replace('ok', '', 1).find('ok') < 0:
+                if nextStr.Severity.value[0] > Severity.Minor.value[0]:
+                    nextStr.Severity = Severity.Minor
+            nodesystemclock = self.stateRE.search(synx['nodesystemclock']).group(1)
+            syncrefstatus = set()
+            for w in self.wordRE.findall(self.stateRE.search(synx['syncrefstatus']).group(1)):
+                if w.lower() != 'failed':
+                    syncrefstatus.add(w)
+            nextStr.Observation += '\n' if nextStr.Observation != '' else ''
+            nextStr.Observation += '%s; %s' % (nodesystemclock, str(syncrefstatus).strip('{}'))
+        return nextStr
+
+    def evaluate_states(self, analyser, nextStr, states):
+        synx = [mo.ldn for mo in states.find('TuSyncRef') if mo.adm != 'locked' and 'TuSyncRef=1' in mo.ldn]
+        if len(synx) > 0:
+            sync = [ref for c in analyser.index.find('get Synchronization=1') for ref in self.syncReferenceRE.findall(c)]
+            for item in synx:
+                if item not in sync:
+                    if nextStr.Severity.value[0] > Severity.Warning.value[0]:
+                        nextStr.Severity = Severity.Warning
+                    nextStr.Observation += '\n' if nextStr.Observation != '' else ''
+                    nextStr.Observation += 'check config'
+        return nextStr
+
+
+@register
+class ZbM3uaCheck(ZbCheck):
+    caption = 'Check the M3UA Associations'
+    command = 'st m3ua'
+    states = True
+
+    def evaluate_states(self, analyser, nextStr, states):
+        # The association type is the first two letters of its id: CS, PS or RS
+        elements = [mo.ldn.rpartition('=')[2][:2] for mo in states.find('M3uAssociation') if mo.op == 'disabled']
+        if elements:
+            cs, ps, rs, MOs = 0, 0, 0, 0
+            for element in elements:
+                if element.lower() == 'cs':
+                    cs += 1
+                elif element.lower() == 'ps':
+                    ps += 1
+                elif element.lower() == 'rs':
+                    rs += 1
+                MOs += 1
+            if cs >= 2 or ps >= 2:
+                nextStr.Severity = Severity.Critical
+            elif cs > 0 or ps > 0 or rs > 0 and nextStr.Severity.value[0] > Severity.Major.value[0]:
+                nextStr.Severity = Severity.Major
+            elif MOs > 0 and nextStr.Severity.value[0] > Severity.Minor.value[0]:
+                nextStr.Severity = Severity.Minor
+            if MOs > 0:
+                nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + 'Num of failed M3UA: %d' % MOs
+        return nextStr
+
+
+@register
+class ZbDevicesCheck(ZbCheck):
+    caption = 'Check RNC CC, DC and PDR devices'
+    command = 'std'
+    outputRE = re.compile(r'(?i)-{10,}\nType +%Up +Total +Enabled\(1\) +Disabled\(0\) +Locked\(L\) +Active\(A\) +'
+                          r'Idle\(I\) +Busy\(B\) +Unallocated\n-{10,}\n'
+                          r'((?:\w+ +\d+% +\d+ +\d+ +\d+ +\d+ +\d+ +\d+ +\d+ +\d+\n)+)-{10,}\n'
+                          r'TOT +\d+% +\d+ +\d+ +\d+ +\d+ +\d+ +\d+ +\d+ +\d')
+
+    def evaluate_lines(self, analyser, nextStr, outputLinesRE):
+        # outputRE has checked the rows: ten fields separated by blanks, aligned with the header or not
+        elements = [line.lower().split() for line in outputLinesRE.group(1).split('\n') if line.strip()]
+        if elements:
+            disabled, unallocate, pdr, cc, dc = 0, 0, 0, 0, 0
+            for element in elements:
+                if element[0] == 'pdr':
+                    pdr = int(element[1].rstrip('%'))
+                elif element[0] == 'cc':
+                    cc = int(element[1].rstrip('%'))
+                elif element[0] == 'dc':
+                    dc = int(element[1].rstrip('%'))
+                disabled += int(element[4])
+                unallocate += int(element[9])
+            nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + 'PDR/CC/DC UP status %d%%/%d%%/%d%%' % (pdr, cc, dc)
+            if disabled > 1 or unallocate > 1:
+                nextStr.Severity = Severity.Critical
+            elif disabled > 0 or unallocate > 0 and nextStr.Severity.value[0] > Severity.Major.value[0]:
+                nextStr.Severity = Severity.Major
+        return nextStr
+
+
+@register
+class ZbIubLinkCheck(ZbCheck):
+    caption = 'Check IubLink and Utrancell resource Status'
+    command = 'strt'
+    outputRE = re.compile(r'(?si)Following \d+ sites are up:.*'
+                          r'Following \d+ sites are totally or partially unavailable:.*-{10,}\n+'
+                          r'(.*)')
+    elementRE = re.compile(r'([\w ]+): +(\d+) of +(\d+) [\w ]+\(([\d.]+) %\)')
+
+    def evaluate_lines(self, analyser, nextStr, outputLinesRE):
+        elements = self.elementRE.findall(outputLinesRE.group(1))
+        if elements:
+            saaa, sabb, saper, ucaaa, ucabb, ucaper = 0, 0, 0.0, 0, 0, 0.0
+            for element in elements:
+                if element[0].lower().strip(' ') == 'site availability':
+                    saaa = int(element[1])
+                    sabb = int(element[2])
+                    saper = float(element[3])
+                elif element[0].lower().strip(' ') == 'unlocked cell availability':
+                    ucaaa = int(element[1])
+                    ucabb = int(element[2])
+                    ucaper = float(element[3])
+            if sabb - saaa >= 5 and ucaper >= 0 and ucaper <= 90:
+                if ucabb - ucaaa >= 40:
                     nextStr.Severity = Severity.Critical
-                elif synx['syncrefstatus'].lower().replace('ok', '', 1).find('ok') < 0:
-                    if nextStr.Severity.value[0] > Severity.Minor.value[0]:
-                        nextStr.Severity = Severity.Minor
-                nodesystemclock = re.search('\(([\w ]+)\)', synx['nodesystemclock']).group(1)
-                syncrefstatus = set()
-                for w in re.findall('(\w+)', re.search(r'\(([\w ]+)\)', synx['syncrefstatus']).group(1)):
-                    if w.lower() != 'failed':
-                        syncrefstatus.add(w)
-                nextStr.Observation += '\n' if nextStr.Observation != '' else ''
-                nextStr.Observation += '%s; %s' % (nodesystemclock, str(syncrefstatus).strip('{}'))
-        outputLinesRE = re.compile(r'(?is)Proxy +Adm +State +Op. State +MO\n={10,}\n.*?\n?={10,}\nTotal: \d+ MOs')
-        if outputLinesRE.search(output):
-            for outputLines in outputLinesRE.findall(output):
-                synx = [k for k in re.findall(r'(?i) +\d+ +\d+ +\((?!LOCKED)\w+\).* (.*TuSyncRef=1.*)', outputLines)]
-                if len(synx) > 0:
-                    c = re.search(r'(?m)^(?:[\w\d.]+)> get Synchronization=1\n((?:.*\n?(?!(?:^[\w\d.]+)>))*)', self.log).group(1)
-                    sync = [k for k in re.findall(r'(?i) >>> syncReference = (.+)', c)]
-                    for item in synx:
-                        if item not in sync:
-                            if nextStr.Severity.value[0] > Severity.Warning.value[0]:
-                                nextStr.Severity = Severity.Warning
-                            nextStr.Observation += '\n' if nextStr.Observation != '' else ''
-                            nextStr.Observation += 'check config'
+                elif ucabb - ucaaa >= 20 and nextStr.Severity.value[0] > Severity.Major.value[0]:
+                    nextStr.Severity = Severity.Major
+                elif ucabb - ucaaa >= 10 and nextStr.Severity.value[0] > Severity.Minor.value[0]:
+                    nextStr.Severity = Severity.Minor
+                elif nextStr.Severity.value[0] > Severity.Warning.value[0]:
+                    nextStr.Severity = Severity.Warning
+            nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + ('%d of %d sites are' +
+                                    ' fully operational (%3.2f %%)\n%d of %d unlocked cells are up (%3.2f %%)') %\
+                                    (saaa, sabb, saper, ucaaa, ucabb, ucaper)
         return nextStr
 
-    def check14(self, nextStr, output):
+
+@register
+class ZbRanapCheck(ZbCheck):
+    caption = 'Check RANAP and Iu link'
+    command = 'st ranap'
+    states = True
+    iuLinkRE = re.compile(r'(?i)CnOperator=.*, (IuLink=1,Ranap=.*CS|IuLink=2,Ranap=.*PS)')
+
+    def evaluate_states(self, analyser, nextStr, states):
+        for mo in states.find('SccpApLocal', 'Ranap'):
+            if mo.op == 'disabled' and (mo.ldn.lower().find('sccpaplocal=ranaplocal') >= 0 or
+                                        self.iuLinkRE.search(mo.ldn) is not None):
+                nextStr.Severity = Severity.Critical
+        nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + 'RANAP is OK'
+        return nextStr
+
+
+@register
+class ZbCvCheck(ZbCheck):
+    caption = "Check CV's stored on RNC"
+    command = 'cvls'
+    severity = Severity.Major
+    outputRE = re.compile(r"(?i)>>> Total: (\d+ CV's, \d+ UP's)")
+    elementRE = re.compile(r"(?i)(\d+)[\w', ]+(\d+)")
+
+    def evaluate_lines(self, analyser, nextStr, outputLinesRE):
+        elements = self.elementRE.findall(outputLinesRE.group(1))
+        if elements:
+            for element in elements:
+                if (int(element[0]) >= 30 and int(element[1]) >= 2 and
+                            nextStr.Severity.value[0] > Severity.Major.value[0]):
+                    nextStr.Severity = Severity.Major
+                elif ((int(element[0]) >= 30 or int(element[1]) >= 2) and
+                            nextStr.Severity.value[0] > Severity.Minor.value[0]):
+                    nextStr.Severity = Severity.Minor
+            nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + "Total: %s CV's, %s UP's" %\
+                                    (element[0], element[1])
+        return nextStr
+
+
+@register
+class ZbDatabaseCheck(ZbCheck):
+    caption = 'Check CV Database inconsistency'
+    command = 'dbc'
+    outputRE = re.compile(r'(?is)={10,}\nDatabase Consistency Check.*?\n={10,}\n(.*?)\n?Conclusion: the database is [\w ]+')
+    elementRE = re.compile(r'(?i) *(.*(YES|NO))')
+
+    def evaluate_lines(self, analyser, nextStr, outputLinesRE):
+        outputLines = outputLinesRE.group(1)
+        if outputLines.lower().find('roamfroeutranetworkdbtable') >= 0:
+            if nextStr.Severity.value[0] > Severity.Major.value[0]:
+                nextStr.Severity = Severity.Major
+        else:
+            for condition, state in self.elementRE.findall(outputLines):
+                if state.lower() == 'yes':
+                    nextStr.Severity = Severity.Critical
+                    nextStr.Observation += '\n' + condition
+        if nextStr.Severity != Severity.Ok:
+            nextStr.Observation = 'database is NOT OK' + nextStr.Observation
+        else:
+            nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + 'database is OK'
+        return nextStr
+
+
+@register
+class ZbSoftwareCheck(ZbCheck):
+    caption = 'Current software level'
+    command = 'cvcu'
+    outputRE = re.compile(r'(?i)((?:[\w+ ]+: +[\w%=/]+ +[\w/]+ +W[\d.]+ \([\w\d.-]+\)\n|-{10,}\n)+)')
+    elementRE = re.compile(r'[\w+ ]+: +[\w%=/]+ +[\w/]+ +W([\d.]+) \([\w\d.-]+\)')
+
+    def evaluate_lines(self, analyser, nextStr, outputLinesRE):
+        elements = self.elementRE.findall(outputLinesRE.group(1))
+        if elements:
+            minVer = ''
+            for element in elements:
+                if element == '14':
+                    if nextStr.Severity.value[0] > Severity.Major.value[0]:
+                        nextStr.Severity = Severity.Major
+                elif element >= '13' and element < '14':
+                    nextStr.Severity = Severity.Critical
+                minVer = element if minVer == '' or element < minVer else minVer
+            nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + 'Release W%s' % minVer
+            nextStr.values['release'] = 'W' + minVer
+        return nextStr
+
+
+@register
+class ZbEthernetCheck(ZbCheck):
+    caption = 'Check ethernet connectivity (i.e. Internal_IP_Transport Vlan)'
+    command = ('steg', 'stip')
+    stegHeaderRE = re.compile(r'(?i)(Board +)(.*)(Speed +)(.*)(Prio +)(.*)(Edge +)(PbitQMap +)(.*)(Vlans)')
+    stegRE = re.compile(r'(?si)Board +.*Speed.*Prio.*Edge +PbitQMap.*Vlans\n={10,}\n'
+                        r'(.*?)={10,}\nTotal: \d+ MOs')
+    stipHeaderRE = re.compile(r'(?i)(Board +)(.*)(Speed +)(.*)(Vlans +)(DscpPbitMap)')
+    stipRE = re.compile(r'(?si)Board.*Speed.*Vlans +DscpPbitMap\n={10,}\n'
+                        r'(.*?)={10,}\nTotal: \d+ MOs')
+
+    def evaluate(self, analyser, nextStr, output):
+        novlans = False
+        prioequal = False
+        pbitqmapnequal = False
+        dscppbitmapnequal = False
+        edgeoff = None
+        header = self.stegHeaderRE.search(output)
+        blocks = self.stegRE.findall(output)
+        if blocks:
+            iboard = 0
+            ispeed = 1
+            iprio = 2
+            iedge=3
+            ipbitqmap = 4
+            ivlans = 5
+            pbitqmap = None
+            prioequal = True
+            prio = None
+            # The columns of steg are as wide as their headers
+            table = ZbFixedWidthTable(header.group(0), ('Board', 'Speed', 'Prio', 'Edge', 'PbitQMap', 'Vlans'))
+            for outputLines in blocks:
+                for element in table.rows(outputLines):
+                    if element[iedge] == 'edge_on':
+                        edgeoff = False
+                    elif edgeoff is None:
+                        edgeoff = True
+                    if pbitqmap is None:
+                        pbitqmap = element[ipbitqmap]
+                    elif pbitqmap != element[ipbitqmap]:
+                        pbitqmapnequal = True
+                    if prio is None:
+                        prio = element[iprio]
+                    elif prio != element[iprio]:
+                        prioequal = False
+                    if ((element[iboard] == 'cmxb' and element[ispeed] == 'nolink' and element[ivlans] == '') or
+                            (element[iboard] == 'ipg' and element[ivlans] == '')):
+                        novlans = True
+        header = self.stipHeaderRE.search(output)
+        blocks = self.stipRE.findall(output)
+        if blocks:
+            iboard = 0
+            ispeed = 1
+            ivlans = 2
+            idscppbitmap = 3
+            dscppbitmap = None
+            table = ZbFixedWidthTable(header.group(0), ('Board', 'Speed', 'Vlans', 'DscpPbitMap'))
+            for outputLines in blocks:
+                for element in table.rows(outputLines):
+                    if dscppbitmap is None:
+                        dscppbitmap = element[idscppbitmap]
+                    elif dscppbitmap != element[idscppbitmap]:
+                        dscppbitmapnequal = True
+                    if ((element[iboard] == 'cmxb' and element[ispeed] == 'nolink' and element[ivlans] == '') or
+                            (element[iboard] == 'ipg' and element[ivlans] == '')):
+                        novlans = True
+        if novlans:
+            nextStr.Severity = Severity.Critical
+        elif prioequal:
+            if nextStr.Severity.value[0] > Severity.Major.value[0]:
+                nextStr.Severity = Severity.Major
+        elif pbitqmapnequal or dscppbitmapnequal:
+            if nextStr.Severity.value[0] > Severity.Minor.value[0]:
+                nextStr.Severity = Severity.Minor
+        elif edgeoff:
+            if nextStr.Severity.value[0] > Severity.Warning.value[0]:
+                nextStr.Severity = Severity.Warning
+        if nextStr.Severity != Severity.Ok:
+            nextStr.Observation = 'NOk'
+        else:
+            nextStr.Observation += 'Ok'
+        return nextStr
+
+
+@register
+class ZbAllocationCheck(ZbCheck):
+    caption = 'Check CC/DC/PDR allocation'
+    command = ('lh cenmp drhcendh cc', 'lh cenmp drhcendh dc', 'lh cenmp drhcendh pdr')
+    handlersRE = re.compile(r'(?is)(\d+): +deviceId +devFroId +boardPiuFroId +admState +opState +capability +subrack '
+                            r'+servingRhModuleId +linkHandlerName +ptmLm +faultTable +state +msgBoard'
+                            r'\n(.*?)\n\1: Summary of resource handlers:')
+    handlerRE = re.compile(r'(?i).*?(\w+) (\[.*\])')
+    modulesRE = re.compile(r'(?is)\d+: +moduleId +boardPiuFroId +moduleRole +connected +subrack +noSpDev +capability +'
+                           r'allocatedShare +properShare +pendingRebalance\n'
+                           r'(.*?)\n?={10,}')
+    moduleRE = re.compile(r'(?is)^\d+: +(\d+)')
+
+    def evaluate(self, analyser, nextStr, output):
         type = ''
         if output.find('drhcendh cc') >= 0:
             type = 'cc'
@@ -331,35 +1382,25 @@ class ZbAnalyser():
             type = 'pdr'
         n, m, p = 0, 0, 1.
         idisunique = True
-        e = re.compile(r'(?is)(\d+): +deviceId +devFroId +boardPiuFroId +admState +opState +capability +subrack '
-                       r'+servingRhModuleId +linkHandlerName +ptmLm +faultTable +state +msgBoard'
-                       r'\n(.*?)\n\1: Summary of resource handlers:')
-        if e.search(output):
-            for outputlines in e.findall(output):
-                e1 = re.compile(r'(?i).*?(\w+) (\[.*\])')
-                if e1.search(outputlines[1]):
-                    for status, msgboard in e1.findall(outputlines[1]):
-                        if ((msgboard.lower().strip(' ') != '[linkestablished synced allocatedsp allocatedrh ]' and
-                             type != 'pdr') or
-                            (msgboard.lower().strip(' ') != '[linkestablished allocatedsp allocatedrh ]' and
-                             type == 'pdr')):
-                            n += 1
-                        if status.lower().strip(' ') == 'idle':
-                            m += 1
-                    p = m / len(e1.findall(outputlines[1]))
-        e = re.compile(r'(?is)\d+: +moduleId +boardPiuFroId +moduleRole +connected +subrack +noSpDev +capability +'
-                       r'allocatedShare +properShare +pendingRebalance\n'
-                       r'(.*?)\n?={10,}')
-        if e.search(output):
-            mset = set()
-            for outputlines in e.findall(output):
-                e1 = re.compile(r'(?is)^\d+: +(\d+)')
-                if e1.search(outputlines):
-                    for moduleid in e1.findall(outputlines):
-                        if moduleid in mset:
-                            idisunique = False
-                            break
-                        mset.add(moduleid)
+        for outputlines in self.handlersRE.findall(output):
+            handlers = self.handlerRE.findall(outputlines[1])
+            if handlers:
+                for status, msgboard in handlers:
+                    if ((msgboard.lower().strip(' ') != '[linkestablished synced allocatedsp allocatedrh ]' and
+                         type != 'pdr') or
+                        (msgboard.lower().strip(' ') != '[linkestablished allocatedsp allocatedrh ]' and
+                         type == 'pdr')):
+                        n += 1
+                    if status.lower().strip(' ') == 'idle':
+                        m += 1
+                p = m / len(handlers)
+        mset = set()
+        for outputlines in self.modulesRE.findall(output):
+            for moduleid in self.moduleRE.findall(outputlines):
+                if moduleid in mset:
+                    idisunique = False
+                    break
+                mset.add(moduleid)
         if n > 2:
             nextStr.Severity = Severity.Critical
         elif n > 0 or idisunique is False:
@@ -372,594 +1413,1089 @@ class ZbAnalyser():
         (type.upper(), 'NOK' if nextStr.Severity != Severity.Ok else 'OK')
         return nextStr
 
-    def check19(self, nextStr, output):
-        outputLinesRE = re.compile(r'(?si)lhsh \d+ mirror stat(.*?)(?:=|\$)')
-        if outputLinesRE.search(output):
+
+@register
+class ZbDisabledMosCheck(ZbCheck):
+    caption = 'Check for disable Mos'
+    command = 'st all 1.*0'
+    severity = Severity.Warning
+    states = True
+
+    def evaluate_states(self, analyser, nextStr, states):
+        # 'st all 1.*0' lists the unlocked and disabled MOs
+        elements = states.select(adm='unlocked', op='disabled')
+        if elements:
+            nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + \
+                                   'Total: %d MOs' % len(elements)
+            if len(elements) > 20:
+                if nextStr.Severity.value[0] > Severity.Warning.value[0]:
+                    nextStr.Severity = Severity.Warning
+        if nextStr.Observation == '':
+            nextStr.Observation = 'Total: %d MOs' % 0
+        return nextStr
+
+
+@register
+class ZbHealthCheckResult(ZbCheck):
+    caption = 'Health check result'
+    command = 'get ManagedElement=1 healthCheckResult|healthCheckSchedule'
+    severity = Severity.Minor
+    outputRE = re.compile(r'(?si)={10,}\n'
+                          r'MO +Attribute +Value\n={10,}\n'
+                          r'(.*?)\n?'
+                          r'={10,}\n'
+                          r'Total: \d+ Mos')
+    elementRE = re.compile(r'(?i)ManagedElement=\d+ +healthCheckResult Struct\{\d\}.*\n?'
+                           r'(?: >>> 1.healthCheckResultCode = (\d+ \(\w+\)).*)?\n?'
+                           r'(?: >>> 2.message = (.*))?\n?'
+                           r'(?: >>> 3.startTime = [\d-]+ [\d:]+)?')
+
+    def evaluate_lines(self, analyser, nextStr, outputLinesRE):
+        element = self.elementRE.search(outputLinesRE.group(1))
+        if element is None or element.groups()[0].lower() != '0 (ok)':
+            if nextStr.Severity.value[0] > Severity.Minor.value[0]:
+                nextStr.Severity = Severity.Minor
+            nextStr.Observation = ('\n' if nextStr.Observation != '' else '') + 'Health Check is NOK'
+        else:
+            nextStr.Observation = ('\n' if nextStr.Observation != '' else '') + 'Health Check is OK'
+        return nextStr
+
+
+@register
+class ZbHealthCheckSchedule(ZbCheck):
+    caption = 'Health check scheduler'
+    command = 'get ManagedElement=1 healthCheckResult|healthCheckSchedule'
+    severity = Severity.Warning
+    outputRE = ZbHealthCheckResult.outputRE
+    elementRE = re.compile(r'ManagedElement=\d+ +healthCheckSchedule t\[(\d+)\].*\n?'
+                           r'(?: >>> Struct\[\d\] +has \d+.*)?\n?'
+                           r'(?: >>> 1[.]time = \d{2}:\d{2})?\n?'
+                           r'(?: >>> 2[.]weekday = \d+ \(\w+\))?')
+
+    def evaluate_lines(self, analyser, nextStr, outputLinesRE):
+        element = self.elementRE.search(outputLinesRE.group(1))
+        if element is None or element.groups()[0] == '0':
+            nextStr.Severity = Severity.Warning
+            nextStr.Observation = ('\n' if nextStr.Observation != '' else '') + 'Health Check Schedule is NOK'
+        else:
+            nextStr.Observation = ('\n' if nextStr.Observation != '' else '') + 'Health Check Schedule is OK'
+        return nextStr
+
+
+@register
+class ZbRepartitionCheck(ZbCheck):
+    caption = 'Check repartition of IubLinks and Cells'
+    command = 'lkra'
+    severity = Severity.Major
+    outputRE = re.compile(r'(?is)Sr +Mod +S +GPB +nIub +CellGPB +CellCC +nCC\n-{10,}\n'
+                          r'(.*?)\n?-{10,}\n+Cell repartition by Board:')
+
+    def evaluate_lines(self, analyser, nextStr, outputLinesRE):
+        # The fields are separated by blanks: Sr, Mod, S, GPB, nIub...
+        elements = [(parts[1], parts[4]) for parts in (line.split() for line in outputLinesRE.group(1).split('\n'))
+                    if len(parts) >= 5 and parts[1].isdigit() and parts[2].isdigit() and parts[4].isdigit()]
+        if elements:
+            mods = {}
+            repartition = sorted([(int(mod), int(niub)) for mod, niub in elements], key=lambda t: t[1], reverse=True)
+            for mod, niub in repartition:
+                if mods == {}:
+                    mods[niub] = [mod]
+                else:
+                    if niub in mods.keys():
+                        mods[niub].append(mod)
+                    else:
+                        break
+            if list(mods.keys())[0] >= 16:
+                if nextStr.Severity.value[0] > Severity.Major.value[0]:
+                    nextStr.Severity = Severity.Major
+            elif list(mods.keys())[0] >= 12:
+                if nextStr.Severity.value[0] > Severity.Warning.value[0]:
+                    nextStr.Severity = Severity.Warning
+            nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + \
+                                   'Max num %d at MODs: %s' % (list(mods.keys())[0],
+                                                               str(list(mods.values())).strip('[]'))
+        return nextStr
+
+
+@register
+class ZbKpiCheck(ZbCheck):
+    caption = 'Check main KPI'
+    command = 'pmr -m 12 -r 1'
+    outputRE = re.compile(r'(?si)Object Counter *\n(.+)')
+    elementRE = re.compile(r'(?i) +(?P<name>\w+) +(?P<value>[\w/.]+)')
+    # The limits if Criteria.xlsx has none, see ZbAnalyser.kpi_rules
+    rules = tuple((counter, 'min', {Severity.Critical: 90, Severity.Major: 95, Severity.Minor: 97, Severity.Warning: 98})
+                  for counter in ('psaccess', 'spchaccess', 'rrcsuc', 'psrabsucc', 'spchrabsuc')) + \
+        tuple((counter, 'max', {Severity.Critical: 4, Severity.Major: 3, Severity.Minor: 2, Severity.Warning: 1.5})
+              for counter in ('spchdrop', 'psdrop'))
+
+    @staticmethod
+    def value(counter):
+        """The counter as a number, None if it is N/A, as is if it is not a number"""
+        if counter == 'N/A':
+            return None
+        try:
+            return float(counter)
+        except ValueError:
+            return counter
+
+    def evaluate_lines(self, analyser, nextStr, outputLinesRE):
+        elements = self.elementRE.findall(outputLinesRE.group(1))
+        if elements:
+            objects = {name.lower(): counter for name, counter in elements}
+            nextStr.values.update((name, self.value(counter)) for name, counter in objects.items())
+            severity = analyser.kpi_rules().grade({name: [value] for name, value in nextStr.values.items()}, 1)[0]
+            if nextStr.Severity.value[0] > severity.value[0]:
+                nextStr.Severity = severity
+            nextStr.Observation += ('\n' if nextStr.Observation != '' else '')
+            nextStr.Observation += 'Main KPIs are %sOK' % ('N' if nextStr.Severity != Severity.Ok else '')
+            nextStr.Observation += '\n' + 'HsAccess %s; HsDrop %s; PSAccess %s; PSCCSR %s; PSDrop %s; ' \
+                                          'RrcSuc %s; SpchAccess %s' % \
+                                          (objects['hsaccess'], objects['hsdrop'], objects['psaccess'],
+                                           objects['psccsr'], objects['psdrop'], objects['rrcsuc'],
+                                           objects['spchaccess'])
+        return nextStr
+
+
+@register
+class ZbRedundancyCheck(ZbCheck):
+    caption = 'Check redundancy state'
+    command = ('lh coremp mirror stat', 'st SwitchInternalLink', 'get SwitchCoreUnit state')
+    mirrorRE = re.compile(r'(?si)lhsh \d+ mirror stat(.*?)(?:=|\$)')
+    connectedRE = re.compile(r'(?i)Peer Disk: +Connected')
+    activeRE = re.compile(r'(?i)Mount Status: +Active')
+    passiveRE = re.compile(r'(?i)Mount Status: +Passive')
+    validRE = re.compile(r'(?i)Peer Disk Status: +Valid')
+    states = True
+    unitsRE = re.compile(r'(?si)MO +Attribute +Value\n={10,}\n(.*?)\n?={10,}\nTotal: \d+ MOs')
+    lineRE = re.compile(r'(.*)')
+
+    def evaluate(self, analyser, nextStr, output):
+        mirrors = self.mirrorRE.findall(output)
+        if mirrors:
             connected, active, passive, status = 0, 0, 0, 0
-            for outputLines in outputLinesRE.findall(output):
-                if re.search('Peer Disk: +Connected', outputLines, re.IGNORECASE):
+            for outputLines in mirrors:
+                if self.connectedRE.search(outputLines):
                     connected += 1
-                if re.search('(?i)Mount Status: +Active', outputLines):
+                if self.activeRE.search(outputLines):
                     active += 1
-                if re.search('(?i)Mount Status: +Passive', outputLines):
+                if self.passiveRE.search(outputLines):
                     passive += 1
-                if re.search('(?i)Peer Disk Status: +Valid', outputLines):
+                if self.validRE.search(outputLines):
                     status += 1
             if connected != 2 or active != 1 or passive != 1 or status == 0:
                 nextStr.Severity = Severity.Critical
-        outputLinesRE = re.compile(r'(?si)MO +Attribute +Value\n={10,}\n(.*?)\n?={10,}\nTotal: \d+ MOs')
-        if outputLinesRE.search(output):
-            for outputLines in outputLinesRE.findall(output):
-                for line in re.findall('(.*)', outputLines):
-                    if line.lower().find('unlocked') >= 0 and line.lower().find('disabled') >= 0:
-                        if nextStr.Severity.value[0] > Severity.Major.value[0]:
-                            nextStr.Severity = Severity.Major
-                        break
-                    if line.lower().find('(locked') >= 0:
-                        if nextStr.Severity.value[0] > Severity.Warning.value[0]:
-                            nextStr.Severity = Severity.Warning
-        outputLinesRE = re.compile(r'(?si)Proxy +Adm +State +Op. State +MO\n={10,}\n(.*?)\n?={10,}\nTotal: \d+ MOs')
-        if outputLinesRE.search(output):
-            for outputLines in outputLinesRE.findall(output):
-                for line in re.findall('(.*)', outputLines):
-                    if line.lower().find('(locked') >= 0:
-                        if nextStr.Severity.value[0] > Severity.Warning.value[0]:
-                            nextStr.Severity = Severity.Warning
-                        break
+        for outputLines in self.unitsRE.findall(output):
+            for line in self.lineRE.findall(outputLines):
+                if line.lower().find('unlocked') >= 0 and line.lower().find('disabled') >= 0:
+                    if nextStr.Severity.value[0] > Severity.Major.value[0]:
+                        nextStr.Severity = Severity.Major
+                    break
+                if line.lower().find('(locked') >= 0:
+                    if nextStr.Severity.value[0] > Severity.Warning.value[0]:
+                        nextStr.Severity = Severity.Warning
+        nextStr.Observation = 'Redundancy %sOK' % ('N' if nextStr.Severity != Severity.Ok else '')
+        return nextStr
+
+    def evaluate_states(self, analyser, nextStr, states):
+        if any(mo.adm == 'locked' for mo in states.find('SwitchInternalLink')):
+            if nextStr.Severity.value[0] > Severity.Warning.value[0]:
+                nextStr.Severity = Severity.Warning
         nextStr.Observation = 'Redundancy %sOK' % ('N' if nextStr.Severity != Severity.Ok else '')
         return nextStr
 
+
+class ZbAnalyser():
+    """zbAnalyser! И этим всё сказано
+
+    Constructing the analyser touches neither the working directory nor openpyxl: the directories are created
+    by make_dirs when the logs of the input directory are listed, the template is looked up when a report is
+    written. check analyses a single log given as text, bytes or path.
+    """
+    def __init__(self):
+        super(ZbAnalyser, self).__init__()
+        # Template of the report, the last file of the template directory if None
+        self.currentTemplate = None
+        self.referenceError = 'Alarms_and_events.xlsx'
+        self.referenceCriteria = 'Criteria.xlsx'
+        self.kpiRules = None
+        # A reference workbook read by openpyxl is saved to its sidecar cache (path.cache), except by check
+        self.writeReferenceCaches = True
+        self.dirs = { 'inputDir': './input', 'outputDir': './output', 'logDir': './log', 'cacheDir': './cache' }
+        # Results of the logs are cached by content in cacheDir, entries older than cacheMaxAge days are evicted
+        # and then the least recently used ones until the cache fits in cacheMaxSize bytes
+        self.useCache = True
+        self.cacheMaxAge = 30
+        self.cacheMaxSize = 256 * 1024 * 1024
+        self.cacheVersion = None
+        # Results of the logs checked by this analyser: (log, size, mtime) -> result of analyse, kept if keepResults
+        self.keepResults = False
+        self.checked = {}
+        # Logs of the nodes of the session logs of the input directory: 'file#node' -> file, start, end, node
+        self.sections = {}
+        # Sections of the plain files of the input directory: file -> (size, mtime), sections (see split_session)
+        self.sessions = {}
+        # Process pool of the workers kept for several reports (see watch), None - results makes one per report
+        self.pool = None
+        # The reports are written over the previous ones instead of taking a new name
+        self.overwriteOutput = False
+        # The checks of the analyser are copies of the registered ones: the instances of CHECKS stay as they are and
+        # another analyser of the process does not add to the match counts of this one
+        self.allChecks = [copy.copy(check) for check in CHECKS.values()]
+        self.checks = list(self.allChecks)
+        # The regex matches of the checks are counted in the statistics (--count-matches), their patterns are
+        # wrapped only then
+        self.countMatches = False
+        self.output = []
+        self.table = ZbResultTable()
+        self.checkStats = []
+        self.wb = None
+        self.log = None
+        self.index = None
+        self.moStates = {}
+        self.alarms = None
+        self.alarmsIndex = None
+        self.alarmsReferenceName = ''
+        self.logdate = None
+        self.stats = ZbStats(self.dirs['logDir'])
+        self.history = ZbHistory('history.sqlite')
+        self.useHistory = True
+
+    def make_dirs(self):
+        """Creates the input, output, log and cache directories that do not exist yet"""
+        for path in self.dirs.values():
+            os.makedirs(path, exist_ok=True)
+
+    def template(self):
+        """Path of the report template"""
+        if self.currentTemplate is None:
+            self.currentTemplate = os.listdir('template/')[-1]
+        return os.path.join('template/', self.currentTemplate)
+
+    def init_alarms(self):
+        self.alarms = self.read_alarms_cache()
+        if self.alarms is None:
+            self.alarms = self.load_alarms()
+            if self.writeReferenceCaches:
+                self.write_alarms_cache()
+        # specificProblem -> perceivedSeverity, the first reference row of the problem wins
+        self.alarmsIndex = {}
+        for alarm in self.alarms:
+            self.alarmsIndex.setdefault(alarm[Alarm.specificProblem.value].lower(),
+                                        alarm[Alarm.perceivedSeverity.value].lower())
+        return self.alarms
+
+    def load_alarms(self):
+        wb = load_openpyxl().load_workbook(filename=self.referenceError)
+        ws = wb['Alarms']
+        alarms = []
+        headerfounded = False
+        for row in ws.iter_rows():
+            if headerfounded:
+                b = []
+                for cell in row:
+                    if cell.column in ('A', 'B', 'C', 'D', 'E', 'F'):
+                        b.append(cell.value.strip(' '))
+                if b[0] is not None:
+                    alarms.append(tuple(b))
+            if row[0].value and row[0].value.lower().strip(' ') == 'specificproblem':
+                headerfounded = True
+        return tuple(alarms)
+
+    def reference_cache_key(self, path):
+        """Path, mtime and content hash of a reference workbook"""
+        import hashlib
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        return os.path.abspath(path), os.stat(path).st_mtime, digest
+
+    def read_reference_cache(self, path):
+        """What was parsed from the reference workbook, from its sidecar cache path.cache; None if there is no cache
+        or the reference was changed since"""
+        try:
+            with open(path + '.cache', 'rb') as f:
+                key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, AttributeError, ImportError):
+            return None
+        if key != self.reference_cache_key(path):
+            return None
+        return value
+
+    def write_reference_cache(self, path, value):
+        try:
+            with open(path + '.cache', 'wb') as f:
+                pickle.dump((self.reference_cache_key(path), value), f, pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print('Cache of %s is not saved: %s' % (path, e))
+
+    def alarms_cache_key(self):
+        """Path, mtime and content hash of the alarms reference"""
+        return self.reference_cache_key(self.referenceError)
+
+    def read_alarms_cache(self):
+        """Alarms from the sidecar cache of the reference, None if the reference was changed since"""
+        return self.read_reference_cache(self.referenceError)
+
+    def write_alarms_cache(self):
+        self.write_reference_cache(self.referenceError, self.alarms)
+
+    def kpi_rules(self):
+        """ZbThresholdRules of 'Check main KPI' from the criteria reference, the defaults of ZbKpiCheck if it has none.
+        The rules parsed are kept in the sidecar cache of the reference (as the alarms are), openpyxl reads the
+        workbook only after it was changed."""
+        if self.kpiRules is None:
+            if os.path.exists(self.referenceCriteria):
+                rules = self.read_reference_cache(self.referenceCriteria)
+                if rules is None:
+                    rules = ZbThresholdRules.fromxlsx(self.referenceCriteria, ZbKpiCheck.caption)
+                    # () - the criteria have no rules of the check
+                    rules = rules.rules if rules else ()
+                    if self.writeReferenceCaches:
+                        self.write_reference_cache(self.referenceCriteria, rules)
+                self.kpiRules = ZbThresholdRules(rules) if rules else None
+            if self.kpiRules is None:
+                self.kpiRules = ZbThresholdRules(ZbKpiCheck.rules)
+        return self.kpiRules
+
+    def results_cache_key(self, f, size=None):
+        """Content hash of the log stream f (as stored for a compressed file; its next size bytes if size is given),
+        of this module, of the checks selected and of the alarms and criteria references"""
+        import hashlib
+        if self.cacheVersion is None:
+            with open(__file__, 'rb') as source:
+                version = hashlib.sha1(source.read())
+            if os.path.exists(self.referenceError):
+                version.update(self.alarms_cache_key()[2].encode('ascii'))
+            if os.path.exists(self.referenceCriteria):
+                with open(self.referenceCriteria, 'rb') as criteria:
+                    version.update(criteria.read())
+            self.cacheVersion = version.hexdigest()
+        digest = hashlib.sha1(self.cacheVersion.encode('ascii'))
+        # The rows depend on the checks selected
+        digest.update('\n'.join(check.caption for check in self.checks).encode('utf-8'))
+        while size is None or size > 0:
+            chunk = f.read(1024 * 1024 if size is None else min(size, 1024 * 1024))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if size is not None:
+                size -= len(chunk)
+        return digest.hexdigest()
+
+    def read_results_cache(self, key):
+        """Rows and log date of the log from the results cache, None if the log is not cached"""
+        path = os.path.join(self.dirs['cacheDir'], key + '.pickle')
+        try:
+            with open(path, 'rb') as f:
+                results = pickle.load(f)
+            # The cache is evicted by the time of the last use
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, AttributeError, ImportError):
+            return None
+        return results
+
+    def write_results_cache(self, key):
+        path = os.path.join(self.dirs['cacheDir'], key + '.pickle')
+        try:
+            # Several workers may write the same log, the entry is replaced as a whole
+            with open('%s.%d' % (path, os.getpid()), 'wb') as f:
+                pickle.dump((self.output, self.logdate), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(f.name, path)
+        except OSError as e:
+            print('Results cache is not saved: %s' % e)
+
+    def evict_results_cache(self):
+        """Removes the cache entries older than cacheMaxAge days, then the least recently used ones
+        until the rest fits in cacheMaxSize"""
+        entries = []
+        for name in os.listdir(self.dirs['cacheDir']):
+            path = os.path.join(self.dirs['cacheDir'], name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort(reverse=True)
+        expired = time.time() - self.cacheMaxAge * 24 * 3600
+        size = 0
+        for mtime, entrySize, path in entries:
+            size += entrySize
+            if mtime < expired or size > self.cacheMaxSize:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def select_checks(self, names=None, severity=None):
+        """Runs only some of the registered checks: those named in names (captions or class names,
+        case-insensitive) that can report severity or a worse one; None - no such restriction.
+        The log index keeps only the commands of the checks selected, the other output blocks are skipped.
+        """
+        checks = list(self.allChecks)
+        if names is not None:
+            wanted = set(name.lower() for name in names)
+            known = set(check.caption.lower() for check in checks) | set(type(check).__name__.lower() for check in checks)
+            unknown = sorted(wanted - known)
+            if unknown:
+                raise ValueError('Unknown checks: %s' % ', '.join(unknown))
+            checks = [check for check in checks
+                      if check.caption.lower() in wanted or type(check).__name__.lower() in wanted]
+        if severity is not None:
+            checks = [check for check in checks if check.severity.value[0] <= severity.value[0]]
+        self.checks = checks
+        return self.checks
+
+    def commands(self):
+        """All commands whose output is used by the checks"""
+        commands = set()
+        for check in self.checks:
+            commands.update(check.commands())
+        return commands
+
     def parseLog(self, nodename):
-        if self.log is None:
+        """Checks self.log, or the already indexed log if self.log is None"""
+        if self.log is not None:
+            self.index = ZbCommandIndex(self.log)
+        if self.index is None:
             print('No log!')
             return
-        logdatere = re.search(r'Logging to file [/\w\d]+/(\d{4}-\d{2}-\d{2})', self.log)
+        self.moStates = {}
+        logdatere = self.index.search(r'Logging to file [/\w\d]+/(\d{4}-\d{2}-\d{2})')
         if logdatere:
-            self.logdate = logdatere.group(1)
+            self.logdate = logdatere[0]
         for num, check in enumerate(self.checks):
-            nextStr = ZbCheckRow(checkname=check[Check.Caption.value], order=num, nodename=nodename)
+            if self.countMatches:
+                check.instrument()
+            start, matches = time.perf_counter(), check.matches
+            nextStr = ZbCheckRow(checkname=check.caption, order=num, nodename=nodename)
             nextStr.Observation = ''
-            commandRegExp = r'(?m)^(?:[\w\d.]+)> %s\n((?:.*\n?(?!(?:^[\w\d.]+)>))*)'
-            if (check[Check.AlarmsReference.value] != '' and
-                os.path.exists(check[Check.AlarmsReference.value]) and
-               self.alarmsReferenceName != check[Check.AlarmsReference.value]):
-                self.alarmsReferenceName = check[Check.AlarmsReference.value]
-                self.init_alarms()
-            outputREO = re.compile(commandRegExp % (check[Check.Command.value] if not isinstance(check[Check.Command.value], tuple) else str(check[Check.Command.value]).replace('(','(?:', 1).replace(", ","|").replace("'","")))
-            if outputREO.search(self.log) is None:
+            outputs = self.index.find(check.command)
+            if not outputs:
                 print('%s - outputRE is fail!' % nextStr.CheckName)
                 continue
-            for output in outputREO.findall(self.log):
-                if output is None:
-                    print('%s - Command RegExp fail' % nextStr.CheckName)
-                    continue
-                commandDateRE = re.search(r'(\d{6})-\d{2}:\d{2}:\d{2}', output)
+            if (check.alarmsReference != '' and
+                os.path.exists(check.alarmsReference) and
+               self.alarmsReferenceName != check.alarmsReference):
+                self.alarmsReferenceName = check.alarmsReference
+                self.init_alarms()
+            for output in outputs:
+                commandDateRE = COMMAND_DATE_RE.search(output)
                 if commandDateRE:
                     if nextStr.DateOf != '' and nextStr.DateOf != commandDateRE.group(1):
                         print("Command date is different!")
                     nextStr.DateOf = commandDateRE.group(1)
-                if nextStr.CheckName == 'Check Network Synchronization' :
-                    nextStr = self.check5(nextStr, output)
-                    continue
-                if nextStr.CheckName == 'Check redundancy state' :
-                    nextStr = self.check19(nextStr, output)
-                    continue
-                if nextStr.CheckName == 'Check CC/DC/PDR allocation' :
-                    nextStr = self.check14(nextStr, output)
-                    continue
-                if nextStr.CheckName == 'Check ethernet connectivity (i.e. Internal_IP_Transport Vlan)' :
-                    novlans = False
-                    prioequal = False
-                    pbitqmapnequal = False
-                    dscppbitmapnequal = False
-                    edgeoff = None
-                    header = re.compile(r'(?i)(Board +)(.*)(Speed +)(.*)(Prio +)(.*)(Edge +)(PbitQMap +)(.*)(Vlans)').search(output)
-                    outputLinesRE = re.compile(r'(?si)Board +.*Speed.*Prio.*Edge +PbitQMap.*Vlans\n={10,}\n'
-                                               r'(.*?)={10,}\nTotal: \d+ MOs')
-                    if outputLinesRE.search(output):
-                        iboard = 0
-                        ispeed = 1
-                        iprio = 2
-                        iedge=3
-                        ipbitqmap = 4
-                        ivlans = 5
-                        pbitqmap = None
-                        prioequal = True
-                        prio = None
-                        for outputLines in outputLinesRE.findall(output):
-                            elementRE = re.compile(r'(?P<board>.{%d}).{%d}(?P<speed>.{%d}).{%d}(?P<prio>.{%d}).{%d}'
-                                                   r'(?P<edge>.{%d})(?P<pbitqmap>.{%d}).{%d}(?P<vlans>.*)' %
-                                                   (len(header.group(1)), len(header.group(2)), len(header.group(3)),
-                                                    len(header.group(4)), len(header.group(5)), len(header.group(6)),
-                                                    len(header.group(7)), len(header.group(8)), len(header.group(9))))
-                            for element in elementRE.findall(outputLines):
-                                if element[iedge].strip(' ').lower() == 'edge_on':
-                                    edgeoff = False
-                                elif edgeoff is None:
-                                    edgeoff = True
-                                if pbitqmap is None:
-                                    pbitqmap = element[ipbitqmap].strip(' ').lower()
-                                elif pbitqmap != element[ipbitqmap].strip(' ').lower():
-                                    pbitqmapnequal = True
-                                if prio is None:
-                                    prio = element[iprio].strip(' ').lower()
-                                elif prio != element[iprio].strip(' ').lower():
-                                    prioequal = False
-                                if ((element[iboard].strip(' ').lower() == 'cmxb' and
-                                     element[ispeed].strip(' ').lower() == 'nolink' and
-                                     element[ivlans].strip(' ').lower() == '') or
-                                    (element[iboard].strip(' ').lower() == 'ipg' and
-                                     element[ivlans].strip(' ').lower() == '')):
-                                    novlans = True
-                    header = re.compile(r'(?i)(Board +)(.*)(Speed +)(.*)(Vlans +)(DscpPbitMap)').search(output)
-                    outputLinesRE = re.compile(r'(?si)Board.*Speed.*Vlans +DscpPbitMap\n={10,}\n'
-                                               r'(.*?)={10,}\nTotal: \d+ MOs')
-                    if outputLinesRE.search(output):
-                        iboard = 0
-                        ispeed = 1
-                        ivlans = 2
-                        idscppbitmap = 3
-                        dscppbitmap = None
-                        for outputLines in outputLinesRE.findall(output):
-                            elementRE = re.compile(r'(?P<board>.{%d}).{%d}(?P<speed>.{%d}).{%d}(?P<vlans>.{%d}).{%d}'
-                                                   r'(?P<dscppbitmap>.*)' %
-                                                   (len(header.group(1)), len(header.group(2)), len(header.group(3)),
-                                                    len(header.group(4)), len(header.group(5)), len(header.group(6))))
-                            for element in elementRE.findall(outputLines):
-                                if dscppbitmap is None:
-                                    dscppbitmap = element[idscppbitmap].strip(' ').lower()
-                                elif dscppbitmap != element[idscppbitmap].strip(' ').lower():
-                                    dscppbitmapnequal = True
-                                if ((element[iboard].strip(' ').lower() == 'cmxb' and
-                                     element[ispeed].strip(' ').lower() == 'nolink' and
-                                     element[ivlans].strip(' ').lower() == '') or
-                                    (element[iboard].strip(' ').lower() == 'ipg' and
-                                     element[ivlans].strip(' ').lower() == '')):
-                                    novlans = True
-                    if novlans:
-                        nextStr.Severity = Severity.Critical
-                    elif prioequal:
-                        if nextStr.Severity.value[0] > Severity.Major.value[0]:
-                            nextStr.Severity = Severity.Major
-                    elif pbitqmapnequal or dscppbitmapnequal:
-                        if nextStr.Severity.value[0] > Severity.Minor.value[0]:
-                            nextStr.Severity = Severity.Minor
-                    elif edgeoff:
-                        if nextStr.Severity.value[0] > Severity.Warning.value[0]:
-                            nextStr.Severity = Severity.Warning
-                    if nextStr.Severity != Severity.Ok:
-                        nextStr.Observation = 'NOk'
-                    else:
-                        nextStr.Observation += 'Ok'
-                    continue
-                outputLinesRE = re.search(check[Check.Output.value], output)
-                if outputLinesRE is None:
-                    print('%s - outputLinesRE is fail!' % nextStr.CheckName)
-                    continue
-                outputLines = outputLinesRE.group(1)
-                elementRE = re.compile(check[Check.Element.value])
-                if check[Check.Command.value] in [self.checks[0][Check.Command.value]]:
-                    if elementRE.search(outputLines):
-                        for element in elementRE.findall(outputLines):
-                            if self.alarmsReferenceName == check[Check.AlarmsReference.value] and self.alarms is not None:
-                                for alarm in self.alarms:
-                                    if element[1].lower().strip(' ') == alarm[Alarm.specificProblem.value].lower():
-                                        if element[0] == 'c' and alarm[Alarm.perceivedSeverity.value].lower() == 'critical':
-                                            nextStr.alarmsCritical += 1
-                                            nextStr.alarmsDetail.append(element[1])
-                                        elif element[0] == 'M' and alarm[Alarm.perceivedSeverity.value].lower() == 'major':
-                                            nextStr.alarmsMajor += 1
-                                            nextStr.alarmsDetail.append(element[1])
-                                        elif element[0] == 'm' and alarm[Alarm.perceivedSeverity.value].lower() == 'minor':
-                                            nextStr.alarmsMinor += 1
-                                        elif element[0] == 'w' and alarm[Alarm.perceivedSeverity.value].lower() == 'warning':
-                                            nextStr.alarmsWarning += 1
-                                        else:
-                                            nextStr.alarmsCollision += 1
-                                            print('%s - Unknown perceivedSeverity!' % nextStr.CheckName)
-                                        # print(element)
-                                        break
-                    nextStr.alarmsTotal = nextStr.alarmsCritical + nextStr.alarmsMajor + nextStr.alarmsMinor + \
-                                          nextStr.alarmsWarning + nextStr.alarmsCollision
-                    if nextStr.alarmsTotal > 0:
-                        nextStr.Observation = ('\n' if nextStr.Observation != '' else '') + 'Total %d alarms:' % \
-                                                                                            nextStr.alarmsTotal
-                        comma = False
-                        if nextStr.alarmsCritical > 0:
-                            nextStr.Observation += ' %d critical' % nextStr.alarmsCritical
-                            comma = True
-                            nextStr.Severity = Severity.Critical
-                        if nextStr.alarmsMajor > 0:
-                            nextStr.Observation += (',' if comma else '') + ' %d major' % nextStr.alarmsMajor
-                            comma = True
-                            if nextStr.Severity.value[0] > Severity.Major.value[0]:
-                                nextStr.Severity = Severity.Major
-                        if nextStr.alarmsMinor > 0:
-                            nextStr.Observation += (',' if comma else '') + ' %d minor' % nextStr.alarmsMinor
-                            comma = True
-                            if nextStr.Severity.value[0] > Severity.Minor.value[0]:
-                                nextStr.Severity = Severity.Minor
-                        if nextStr.alarmsWarning > 0:
-                            nextStr.Observation += (',' if comma else '') + ' %d warning' % nextStr.alarmsWarning
-                            comma = True
-                            if nextStr.Severity.value[0] > Severity.Warning.value[0]:
-                                nextStr.Severity = Severity.Warning
-                if check[Check.Command.value] == self.checks[1][Check.Command.value]:
-                    if elementRE.search(outputLines):
-                        sum = 0
-                        MOs = set()
-                        for element in elementRE.findall(outputLines):
-                            if element[3] is not None and element[3].lower().find('ranap_cninitiatedresetresource') >= 0:
-                                nextStr.Severity = Severity.Critical
-                                MOs.add(element[0])
-                                sum += 1
-                        if sum != 0:
-                            if nextStr.Observation != '':
-                                nextStr.Observation += '\n'
-                            nextStr.Observation += 'Ranap_CNInitiatedResetResource %s sum: %d' % \
-                                                   (str(MOs).strip('{}').replace("'",""), sum)
-                        sum = 0
-                        MOs = set()
-                        for element in elementRE.findall(outputLines):
-                            if element[3] is not None and element[3].lower().find('ipethpacketdatarouter_cnnotresponding' +
-                                                                                  'togtpecho') >= 0:
-                                if nextStr.Severity.value[0] > Severity.Major.value[0]:
-                                    nextStr.Severity = Severity.Major
-                                MOs.add(element[0])
-                                sum += 1
-                        if sum != 0:
-                            if nextStr.Observation != '':
-                                nextStr.Observation += '\n'
-                            nextStr.Observation += 'IpEthPacketDataRouter_CnNotRespondingToGTPEcho %s sum: %d' % \
-                                                   (str(MOs).strip('{}').replace("'",""), sum)
-                        sum = 0
-                        MOs = set()
-                        prevdevice = ''
-                        for element in elementRE.findall(outputLines):
-                            if element[1] is None or element[1] == '':
-                                continue
-                            if prevdevice != '' and prevdevice != element[2]:
-                                nextStr.Severity = Severity.Critical
-                            elif int(element[1]) > 1 and nextStr.Severity.value[0] > Severity.Major.value[0]:
-                                nextStr.Severity = Severity.Major
-                            elif int(element[1]) == 1 and nextStr.Severity.value[0] > Severity.Minor.value[0]:
-                                nextStr.Severity = Severity.Minor
-                            MOs.add(', '.join(['Crash on %s' % element[1], 'device=%s' % element[2]]))
-                            sum += 1
-                        if sum != 0:
-                            if nextStr.Observation != '':
-                                nextStr.Observation += '\n'
-                            nextStr.Observation += '%s sum: %d' % (str(MOs).strip('{}').replace("'",""), sum)
-                        sum = 0
-                        MOs = set()
-                        for element in elementRE.findall(outputLines):
-                            if element[3] is not None and element[3].lower().find('a non-local mau has been chosen as the' +
-                                                                                  ' active client') >= 0:
-                                if nextStr.Severity.value[0] > Severity.Warning.value[0]:
-                                    nextStr.Severity = Severity.Warning
-                                MOs.add(element[0])
-                                sum += 1
-                        if sum != 0:
-                            if nextStr.Observation != '':
-                                nextStr.Observation += '\n'
-                            nextStr.Observation += 'A Non-Local MAU Has Been Chosen as the Active Client %s sum: %d' % \
-                                                   (str(MOs).strip('{}').replace("'",""), sum)
-                if check[Check.Command.value] in [self.checks[2][Check.Command.value]]:
-                    sum = 0
-                    if elementRE.search(outputLines):
-                        for element in elementRE.findall(outputLines):
-                            opdate = datetime.date(int(element[0]), int(element[1]), int(element[2]))
-                            repdate = datetime.date(2000 + int(nextStr.DateOf[0:2]), int(nextStr.DateOf[2:4]), int(nextStr.DateOf[4:6]))
-                            if (repdate - opdate).days <= 14:
-                                sum += 1
-                    if sum > 1:
-                        nextStr.Severity = Severity.Critical
-                    if sum == 1:
-                        nextStr.Severity = Severity.Major
-                    nextStr.Observation = 'Node uptime since last restart: %s days, %s hours' % \
-                                          (outputLinesRE.group(2), outputLinesRE.group(3))
-                if check[Check.Command.value] in [self.checks[3][Check.Command.value]]:
-                    if elementRE.search(outputLines):
-                        for element in elementRE.findall(outputLines):
-                            if element[0]+element[1]+element[2] != nextStr.DateOf and nextStr.Severity.value[0] > Severity.Minor.value[0]:
-                                nextStr.Severity = Severity.Minor
-                                if nextStr.Observation != '':
-                                    nextStr.Observation += '\n'
-                                nextStr.Observation += 'Please check NTP'
-                                break
-                if check[Check.Command.value] in [self.checks[4][Check.Command.value]]:
-                    pass
-                if check[Check.Command.value] in [self.checks[5][Check.Command.value]]:
-                    if elementRE.search(outputLines):
-                        cs, ps, rs, MOs = 0, 0, 0, 0
-                        for element in elementRE.findall(outputLines):
-                            if element.lower() == 'cs':
-                                cs += 1
-                            elif element.lower() == 'ps':
-                                ps += 1
-                            elif element.lower() == 'rs':
-                                rs += 1
-                            MOs += 1
-                        if cs >= 2 or ps >= 2:
-                            nextStr.Severity = Severity.Critical
-                        elif cs > 0 or ps > 0 or rs > 0 and nextStr.Severity.value[0] > Severity.Major.value[0]:
-                            nextStr.Severity = Severity.Major
-                        elif MOs > 0 and nextStr.Severity.value[0] > Severity.Minor.value[0]:
-                            nextStr.Severity = Severity.Minor
-                        if MOs > 0:
-                            nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + 'Num of failed M3UA: %d' % MOs
-                if check[Check.Command.value] in [self.checks[6][Check.Command.value]]:
-                    if elementRE.search(outputLines):
-                        disabled, unallocate, pdr, cc, dc = 0, 0, 0, 0, 0
-                        for element in elementRE.findall(outputLines):
-                            if element[0].lower() == 'pdr':
-                                pdr = int(element[1])
-                            elif element[0].lower() == 'cc':
-                                cc = int(element[1])
-                            elif element[0].lower() == 'dc':
-                                dc = int(element[1])
-                            disabled += int(element[4])
-                            unallocate += int(element[9])
-                        nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + 'PDR/CC/DC UP status %d%%/%d%%/%d%%' % (pdr, cc, dc)
-                        if disabled > 1 or unallocate > 1:
-                            nextStr.Severity = Severity.Critical
-                        elif disabled > 0 or unallocate > 0 and nextStr.Severity.value[0] > Severity.Major.value[0]:
-                            nextStr.Severity = Severity.Major
-                if check[Check.Command.value] == self.checks[7][Check.Command.value]:
-                    if elementRE.search(outputLines):
-                        saaa, sabb, saper, ucaaa, ucabb, ucaper = 0, 0, 0.0, 0, 0, 0.0
-                        for element in elementRE.findall(outputLines):
-                            if element[0].lower().strip(' ') == 'site availability':
-                                saaa = int(element[1])
-                                sabb = int(element[2])
-                                saper = float(element[3])
-                            elif element[0].lower().strip(' ') == 'unlocked cell availability':
-                                ucaaa = int(element[1])
-                                ucabb = int(element[2])
-                                ucaper = float(element[3])
-                        if sabb - saaa >= 5 and ucaper >= 0 and ucaper <= 90:
-                            if ucabb - ucaaa >= 40:
-                                nextStr.Severity = Severity.Critical
-                            elif ucabb - ucaaa >= 20 and nextStr.Severity.value[0] > Severity.Major.value[0]:
-                                nextStr.Severity = Severity.Major
-                            elif ucabb - ucaaa >= 10 and nextStr.Severity.value[0] > Severity.Minor.value[0]:
-                                nextStr.Severity = Severity.Minor
-                            elif nextStr.Severity.value[0] > Severity.Warning.value[0]:
-                                nextStr.Severity = Severity.Warning
-                        nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + ('%d of %d sites are' +
-                                                ' fully operational (%3.2f %%)\n%d of %d unlocked cells are up (%3.2f %%)') %\
-                                                (saaa, sabb, saper, ucaaa, ucabb, ucaper)
-                if check[Check.Command.value] == self.checks[8][Check.Command.value]:
-                    if elementRE.search(outputLines):
-                        for element in elementRE.findall(outputLines):
-                            if (element[0].lower().find('sccpaplocal=ranaplocal') >= 0 or
-                                re.search(r'(?i)CnOperator=.*, (IuLink=1,Ranap=.*CS|IuLink=2,Ranap=.*PS)',
-                                          element[0].lower()) is not None):
-                                nextStr.Severity = Severity.Critical
-                    nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + 'RANAP is OK'
-                if check[Check.Command.value] == self.checks[9][Check.Command.value]:
-                    if elementRE.search(outputLines):
-                        for element in elementRE.findall(outputLines):
-                            if (int(element[0]) >= 30 and int(element[1]) >= 2 and
-                                        nextStr.Severity.value[0] > Severity.Major.value[0]):
-                                nextStr.Severity = Severity.Major
-                            elif ((int(element[0]) >= 30 or int(element[1]) >= 2) and
-                                        nextStr.Severity.value[0] > Severity.Minor.value[0]):
-                                nextStr.Severity = Severity.Minor
-                        nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + "Total: %s CV's, %s UP's" %\
-                                                (element[0], element[1])
-                if check[Check.Command.value] == self.checks[10][Check.Command.value]:
-                    if outputLines.lower().find('roamfroeutranetworkdbtable') >= 0:
-                        if nextStr.Severity.value[0] > Severity.Major.value[0]:
-                            nextStr.Severity = Severity.Major
-                    else:
-                        if elementRE.search(outputLines):
-                            for condition, state in elementRE.findall(outputLines):
-                                if state.lower() == 'yes':
-                                    nextStr.Severity = Severity.Critical
-                                    nextStr.Observation += '\n' + condition
-                    if nextStr.Severity != Severity.Ok:
-                        nextStr.Observation = 'database is NOT OK' + nextStr.Observation
-                    else:
-                        nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + 'database is OK'
-                if check[Check.Command.value] == self.checks[11][Check.Command.value]:
-                    if elementRE.search(outputLines):
-                        minVer = ''
-                        for element in elementRE.findall(outputLines):
-                            if element == '14':
-                                if nextStr.Severity.value[0] > Severity.Major.value[0]:
-                                    nextStr.Severity = Severity.Major
-                            elif element >= '13' and element < '14':
-                                nextStr.Severity = Severity.Critical
-                            minVer = element if minVer == '' or element < minVer else minVer
-                        nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + 'Release W%s' % minVer
-                if check[Check.Command.value] == self.checks[14][Check.Command.value]:
-                    if elementRE.search(outputLines):
-                        for element in elementRE.findall(outputLines):
-                            pass
-                        nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + \
-                                               'Total: %d MOs' % len(elementRE.findall(outputLines))
-                        if len(elementRE.findall(outputLines)) > 20:
-                            if nextStr.Severity.value[0] > Severity.Warning.value[0]:
-                                nextStr.Severity = Severity.Warning
-                    if nextStr.Observation == '':
-                        nextStr.Observation = 'Total: %d MOs' % 0
-                if (check[Check.Command.value] == self.checks[15][Check.Command.value] and
-                        check[Check.Caption.value] == self.checks[15][Check.Caption.value]):
-                    element = elementRE.search(outputLines)
-                    if element is None or element.groups()[0].lower() != '0 (ok)':
-                        if nextStr.Severity.value[0] > Severity.Minor.value[0]:
-                            nextStr.Severity = Severity.Minor
-                        nextStr.Observation = ('\n' if nextStr.Observation != '' else '') + 'Health Check is NOK'
-                    else:
-                        nextStr.Observation = ('\n' if nextStr.Observation != '' else '') + 'Health Check is OK'
-                if (check[Check.Command.value] == self.checks[16][Check.Command.value] and
-                        check[Check.Caption.value] == self.checks[16][Check.Caption.value]):
-                    element = elementRE.search(outputLines)
-                    if element is None or element.groups()[0] == '0':
-                        nextStr.Severity = Severity.Warning
-                        nextStr.Observation = ('\n' if nextStr.Observation != '' else '') + 'Health Check Schedule is NOK'
-                    else:
-                        nextStr.Observation = ('\n' if nextStr.Observation != '' else '') + 'Health Check Schedule is OK'
-                if check[Check.Command.value] == self.checks[17][Check.Command.value]:
-                    if elementRE.search(outputLines):
-                        mods = {}
-                        repartition = sorted([(int(mod), int(niub)) for mod, niub in elementRE.findall(outputLines)],key=lambda t: t[1], reverse=True)
-                        for mod, niub in repartition:
-                            if mods == {}:
-                                mods[niub] = [mod]
-                            else:
-                                if niub in mods.keys():
-                                    mods[niub].append(mod)
-                                else:
-                                    break
-                        if list(mods.keys())[0] >= 16:
-                            if nextStr.Severity.value[0] > Severity.Major:
-                                nextStr.Severity = Severity.Major
-                        elif list(mods.keys())[0] >= 12:
-                            if nextStr.Severity.value[0] > Severity.Warning:
-                                nextStr.Severity = Severity.Warning
-                        nextStr.Observation += ('\n' if nextStr.Observation != '' else '') + \
-                                               'Max num %d at MODs: %s' % (list(mods.keys())[0],
-                                                                           str(list(mods.values())).strip('[]'))
-                        print(mods)
-                if check[Check.Command.value] == self.checks[18][Check.Command.value]:
-                    if elementRE.search(outputLines):
-                        objects = {name.lower(): counter for name, counter in elementRE.findall(outputLines)}
-                        if ((objects['psaccess'] != 'N/A' and float(objects['psaccess']) <= 90) or
-                            (objects['spchaccess'] != 'N/A' and float(objects['spchaccess']) <= 90) or
-                            (objects['rrcsuc'] != 'N/A' and float(objects['rrcsuc']) <= 90) or
-                            (objects['psrabsucc'] != 'N/A' and float(objects['psrabsucc']) <= 90) or
-                            (objects['spchrabsuc'] != 'N/A' and float(objects['spchrabsuc']) <= 90) or
-                            (objects['spchdrop'] != 'N/A' and float(objects['spchdrop']) >= 4) or
-                            (objects['psdrop'] != 'N/A' and float(objects['psdrop']) >= 4)):
-                            nextStr.Severity = Severity.Critical
-                        elif ((objects['psaccess'] != 'N/A' and float(objects['psaccess']) <= 95) or
-                              (objects['spchaccess'] != 'N/A' and float(objects['spchaccess']) <= 95) or
-                              (objects['rrcsuc'] != 'N/A' and float(objects['rrcsuc']) <= 95) or
-                              (objects['psrabsucc'] != 'N/A' and float(objects['psrabsucc']) <= 95) or
-                              (objects['spchrabsuc'] != 'N/A' and float(objects['spchrabsuc']) <= 95) or
-                              (objects['spchdrop'] != 'N/A' and float(objects['spchdrop']) >= 3) or
-                              (objects['psdrop'] != 'N/A' and float(objects['psdrop']) >= 3)):
-                            if nextStr.Severity.value[0] > Severity.Major.value[0]:
-                                nextStr.Severity = Severity.Major
-                        elif ((objects['psaccess'] != 'N/A' and float(objects['psaccess']) <= 97) or
-                              (objects['spchaccess'] != 'N/A' and float(objects['spchaccess']) <= 97) or
-                              (objects['rrcsuc'] != 'N/A' and float(objects['rrcsuc']) <= 97) or
-                              (objects['psrabsucc'] != 'N/A' and float(objects['psrabsucc']) <= 97) or
-                              (objects['spchrabsuc'] != 'N/A' and float(objects['spchrabsuc']) <= 97) or
-                              (objects['spchdrop'] != 'N/A' and float(objects['spchdrop']) >= 2) or
-                              (objects['psdrop'] != 'N/A' and float(objects['psdrop']) >= 2)):
-                            if nextStr.Severity.value[0] > Severity.Minor.value[0]:
-                                nextStr.Severity = Severity.Minor
-                        elif ((objects['psaccess'] != 'N/A' and float(objects['psaccess']) <= 98) or
-                              (objects['spchaccess'] != 'N/A' and float(objects['spchaccess']) <= 98) or
-                              (objects['rrcsuc'] != 'N/A' and float(objects['rrcsuc']) <= 98) or
-                              (objects['psrabsucc'] != 'N/A' and float(objects['psrabsucc']) <= 98) or
-                              (objects['spchrabsuc'] != 'N/A' and float(objects['spchrabsuc']) <= 98) or
-                              (objects['spchdrop'] != 'N/A' and float(objects['spchdrop']) >= 1.5) or
-                              (objects['psdrop'] != 'N/A' and float(objects['psdrop']) >= 1.5)):
-                            if nextStr.Severity.value[0] > Severity.Warning.value[0]:
-                                nextStr.Severity = Severity.Warning
-                        nextStr.Observation += ('\n' if nextStr.Observation != '' else '')
-                        nextStr.Observation += 'Main KPIs are %sOK' % ('N' if nextStr.Severity != Severity.Ok else '')
-                        nextStr.Observation += '\n' + 'HsAccess %s; HsDrop %s; PSAccess %s; PSCCSR %s; PSDrop %s; ' \
-                                                      'RrcSuc %s; SpchAccess %s' % \
-                                                      (objects['hsaccess'], objects['hsdrop'], objects['psaccess'],
-                                                       objects['psccsr'], objects['psdrop'], objects['rrcsuc'],
-                                                       objects['spchaccess'])
+                nextStr = check.evaluate(self, nextStr, output)
+            if check.states:
+                nextStr = check.evaluate_states(self, nextStr, self.mo_states(*check.commands()))
             if nextStr.Observation == '':
                 nextStr.Observation = 'No alarms'
             print('%s - Done' % nextStr.CheckName)
             self.output.append(nextStr)
+            self.checkStats.append({'check': check.caption, 'wall': time.perf_counter() - start,
+                                    'bytes': sum(len(output) for output in outputs), 'blocks': len(outputs)})
+            if check.instrumented:
+                self.checkStats[-1]['matches'] = check.matches - matches
 
-    def savexls(self,filename):
+    def mo_states(self, *commands):
+        """MO states of the node being checked from the outputs of the st commands among commands only, so that a
+        check does not see the MOs listed by the commands of the others. The table is parsed once per node and
+        st commands (self.moStates)."""
+        commands = tuple(command for command in commands if command[:3] == 'st ')
+        if commands not in self.moStates:
+            self.moStates[commands] = ZbMoStateTable(self.index.find(commands))
+        return self.moStates[commands]
+
+    def output_path(self, filename, extension='.xlsx'):
+        """Path of a new file of the output directory: filename, filename1, filename2... whichever is free"""
         count = 1
-        output = os.path.join(self.dirs['outputDir'], filename+'.xlsx')
-        while os.path.exists(output):
-            output = os.path.join(self.dirs['outputDir'], filename+str(count)+'.xlsx')
+        output = os.path.join(self.dirs['outputDir'], filename+extension)
+        while os.path.exists(output) and not self.overwriteOutput:
+            output = os.path.join(self.dirs['outputDir'], filename+str(count)+extension)
             count += 1
+        return output
+
+    def savexls(self,filename):
+        output = self.output_path(filename)
         self.wb.save(output)
         return output
 
-    def writexls(self,filename):
-        fs_init_row = 6
-        self.wb = openpyxl.load_workbook(filename = os.path.join('template/', self.currentTemplate))
-        fs = self.wb['Front Sheet']
+    def logs(self, inFiles=None):
+        """Logs of the files inFiles of the input directory (all of them if None): a zip archive gives a log
+        'archive.zip/member' per member, a plain session log of several nodes a log 'file#node' per node
+        (see split_session), any other file (plain or compressed, see COMPRESSED) is a log"""
+        self.make_dirs()
+        logs = []
+        for inFile in sorted(os.listdir(self.dirs['inputDir'])) if inFiles is None else inFiles:
+            if os.path.splitext(inFile)[1].lower() == '.zip':
+                import zipfile
+                try:
+                    with zipfile.ZipFile(os.path.join(self.dirs['inputDir'], inFile)) as archive:
+                        logs.extend('%s/%s' % (inFile, name) for name in archive.namelist() if not name.endswith('/'))
+                except (OSError, zipfile.BadZipFile) as e:
+                    print('%s - %s' % (inFile, e))
+            elif os.path.splitext(inFile)[1].lower() not in COMPRESSED:
+                logs.extend(self.split_session(inFile))
+            else:
+                logs.append(inFile)
+        return logs
+
+    def split_session(self, inFile):
+        """Logs of a plain file of the input directory: the file itself, or a log 'file#node' per node if the file
+        is a session log running the commands against several nodes one after another (see scan_session).
+        The offsets of the sections are kept in self.sections, a worker reads only the section of its node.
+        The sections of a file are kept by its size and modification time in self.sessions, the file is scanned
+        again only once it changed (not by every round of watch)."""
+        try:
+            stat = os.stat(os.path.join(self.dirs['inputDir'], inFile))
+        except OSError:
+            return [inFile]
+        key = (stat.st_size, stat.st_mtime_ns)
+        if self.sessions.get(inFile, (None,))[0] != key:
+            self.sessions[inFile] = (key, self.scan_session(inFile))
+        sections = self.sessions[inFile][1]
+        self.sections.update(sections)
+        return list(sections) or [inFile]
+
+    def scan_session(self, inFile):
+        """Sections of the nodes of a session log, log 'file#node' -> section (see self.sections) in log order;
+        empty if the file is the log of a single node.
+        The nodes are found in one pass over the memory-mapped file: a 'Logging to file' header starts the section
+        of a node, named after the file it logs to, unless the node (its prompt, or the file logged to if there is
+        no prompt) is the one of the section before: logging restarted on the same node goes on with its section."""
+        import mmap
+        sections = []
+        try:
+            with open(os.path.join(self.dirs['inputDir'], inFile), 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return {}
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as log:
+                    size = len(log)
+                    for header in SESSION_RE.finditer(log):
+                        target = os.path.basename(header.group(1).decode('ascii', 'replace').strip().replace('\\', '/'))
+                        prompt = ZbCommandIndex.promptBytesRE.search(log, header.end())
+                        node = log[prompt.start() + 1:prompt.end() - 1] if prompt else target
+                        if not sections or sections[-1][2] != node:
+                            sections.append((header.start(), target or str(len(sections) + 1), node))
+        except (OSError, ValueError):
+            return {}
+        if len(sections) < 2:
+            return {}
+        logs = collections.OrderedDict()
+        for num, (start, node, _) in enumerate(sections):
+            name, count = node, 1
+            while '%s#%s' % (inFile, name) in logs:
+                count += 1
+                name = '%s.%d' % (node, count)
+            # Whatever precedes the first header belongs to the first node
+            end = sections[num + 1][0] if num + 1 < len(sections) else size
+            logs['%s#%s' % (inFile, name)] = (inFile, start if num else 0, end, name)
+        return logs
+
+    def node_name(self, log):
+        """Name of the node of the log: the name of the zip member or of the file without the compression extension,
+        the node of a section of a session log"""
+        if log in self.sections:
+            return self.sections[log][3]
+        inFile, _, member = log.partition('/')
+        name = os.path.basename(member) if member else inFile
+        root, extension = os.path.splitext(name)
+        return root if extension.lower() in COMPRESSED else name
+
+    def open_log(self, log, decompress=True):
+        """The log as a binary stream, decompressing if the log is compressed or a member of a zip archive;
+        the section of a node of a session log is its file positioned at the start of the section (see log_range).
+        :param decompress: False - a compressed file is read as it is stored (a zip member is still decompressed)
+        """
+        if log in self.sections:
+            f = open(os.path.join(self.dirs['inputDir'], self.sections[log][0]), 'rb')
+            f.seek(self.sections[log][1])
+            return f
+        inFile, _, member = log.partition('/')
+        path = os.path.join(self.dirs['inputDir'], inFile)
+        if member:
+            import zipfile
+            with zipfile.ZipFile(path) as archive:
+                # The member stream keeps the archive file open by itself
+                return archive.open(member)
+        return ((decompress and compressed_opener(inFile)) or open)(path, 'rb')
+
+    def log_range(self, log):
+        """Start and end of the log in the stream of open_log: the bounds of the section of a node of a session
+        log, (0, None) - the whole stream"""
+        return self.sections[log][1:3] if log in self.sections else (0, None)
+
+    def analyse(self, inFile):
+        """Checks one log of the input directory (see logs), returns its rows, log date and statistics of the checks
+        (see parseLog), the first item of which is the time of indexing the log.
+        A plain log is memory-mapped, a compressed one is decompressed by chunks keeping only the blocks of the
+        commands checked (see ZbCommandIndex.fromstream); its cache key is the hash of the compressed file."""
+        self.log = None
+        self.output = []
+        self.logdate = None
+        nodename = self.node_name(inFile)
+        start = time.perf_counter()
+        begin, end = self.log_range(inFile)
+        key = None
+        if self.useCache:
+            with self.open_log(inFile, decompress=False) as f:
+                key = self.results_cache_key(f, None if end is None else end - begin)
+                cached = self.read_results_cache(key)
+                if cached is not None:
+                    self.output, self.logdate = cached
+                    # The same log may come under another name
+                    for row in self.output:
+                        row.NodeName = nodename
+                    self.checkStats = [{'check': None, 'wall': time.perf_counter() - start, 'bytes': f.tell() - begin,
+                                        'cached': True}]
+                    return self.output, self.logdate, self.checkStats
+        with self.open_log(inFile) as f:
+            # The section of a session log is indexed in place in the mapped file
+            self.index = (ZbCommandIndex.mapfile(f, self.commands(), None, begin, end)
+                          if isinstance(f, io.BufferedReader) else ZbCommandIndex.fromstream(f, self.commands()))
+            self.checkStats = [{'check': None, 'wall': time.perf_counter() - start, 'bytes': self.index.size}]
+            try:
+                self.parseLog(nodename)
+            finally:
+                self.index.close()
+                self.index = None
+        if key:
+            self.write_results_cache(key)
+        return self.output, self.logdate, self.checkStats
+
+    def check(self, log, nodename=''):
+        """Checks a single log and returns its rows (ZbCheckRow), the log date is left in self.logdate.
+        The log is its text (str), its content (bytes-like) or the path of its file (os.PathLike, possibly
+        compressed, see COMPRESSED). Nothing is written: neither the results cache, nor the history, nor the sidecar
+        caches of the references. The alarms and criteria references are taken from their sidecar caches if they
+        are up to date (written by a report run); otherwise openpyxl reads the workbooks, once per analyser.
+        :param nodename: name of the node in the rows, by default the name of the file of a path
+        """
+        self.log = None
+        self.output = []
+        self.logdate = None
+        self.checkStats = []
+        if isinstance(log, os.PathLike):
+            path = os.fspath(log)
+            nodename = nodename or self.node_name(os.path.basename(path))
+            opener = compressed_opener(path)
+            with (opener or open)(path, 'rb') as f:
+                self.index = (ZbCommandIndex.fromstream(f, self.commands()) if opener else
+                              ZbCommandIndex.mapfile(f, self.commands()))
+        else:
+            self.index = ZbCommandIndex(log, self.commands())
+        writeReferenceCaches = self.writeReferenceCaches
+        self.writeReferenceCaches = False
+        try:
+            self.parseLog(nodename)
+        finally:
+            self.writeReferenceCaches = writeReferenceCaches
+            self.index.close()
+            self.index = None
+        return self.output
+
+    def checked_key(self, inFile):
+        """Log (or file of the input directory), size and modification time of its file"""
+        stat = os.stat(os.path.join(self.dirs['inputDir'], self.sections[inFile][0] if inFile in self.sections else
+                                    inFile.partition('/')[0]))
+        return inFile, stat.st_size, stat.st_mtime_ns
+
+    def results(self, inFiles, workers=1):
+        """Results of analyse for the logs in the order of inFiles, checked by a pool of workers if workers > 1
+        (self.pool if there is one). If keepResults, the logs already checked by this analyser and not changed since
+        are not checked again."""
+        keys = [self.checked_key(inFile) for inFile in inFiles] if self.keepResults else [None] * len(inFiles)
+        todo = [inFile for inFile, key in zip(inFiles, keys) if key not in self.checked]
+        ownPool = None if self.pool or workers < 2 or len(todo) < 2 else self.worker_pool(workers)
+        pool = self.pool or ownPool
+        try:
+            # The sections of the session logs change between the reports, a task takes the one of its log
+            analysed = (pool.imap(analyse_log, [(inFile, self.sections.get(inFile)) for inFile in todo]) if pool else
+                        (self.analyse(inFile) for inFile in todo))
+            for key in keys:
+                result = self.checked[key] if key in self.checked else next(analysed)
+                if key is not None:
+                    self.checked[key] = result
+                yield result
+        finally:
+            if ownPool:
+                self.stop_pool(ownPool)
+
+    def worker_pool(self, workers):
+        """Process pool of the workers checking the logs with the settings and the checks of this analyser"""
+        import multiprocessing
+        settings = {'useCache': self.useCache, 'countMatches': self.countMatches}
+        return multiprocessing.Pool(workers, init_worker, (settings, [check.caption for check in self.checks]))
+
+    def stop_pool(self, pool):
+        """Stops the workers of the pool and waits for them; they ignore Ctrl+C, which stops the main process only"""
+        pool.terminate()
+        pool.join()
+
+    def add_results(self, output, logdate):
+        """Adds the rows of a log to self.table and their values to the history under the log date
+        (or the date of the commands if the log has none)"""
+        self.table.extend(output, logdate)
+        if self.useHistory and output:
+            if not logdate:
+                dateOf = next((row.DateOf for row in output if row.DateOf), '')
+                logdate = '20%s-%s-%s' % (dateOf[0:2], dateOf[2:4], dateOf[4:6]) if dateOf else None
+            if logdate:
+                values = {}
+                for row in output:
+                    values.update(row.values)
+                self.history.add(output[0].NodeName, logdate, values)
+
+    def finish(self):
+        """End of a report: the results cache is evicted, the statistics and the history are closed"""
+        if self.useCache:
+            self.evict_results_cache()
+        self.stats.close()
+        self.history.close()
+
+    def write_stats(self, inFile, checkStats, openpyxlTime):
+        """Writes the statistics of a node: its checks and the node record"""
+        inFile = self.node_name(inFile)
+        index, checks = checkStats[0], checkStats[1:]
+        for stats in checks:
+            self.stats.write('check', inFile, **stats)
+        self.stats.write('node', inFile, index=index['wall'], bytes=index['bytes'], cached=index.get('cached', False),
+                         parse=sum(stats['wall'] for stats in checks), openpyxl=openpyxlTime)
+
+    def summary_rows(self, template, columns):
+        """Values of the rows of 'Error list. Summary': the node and the template row of the controller sheet
+        rendered for a row of self.table, for all the rows which are not Ok in the order of ZbResultTable.summary"""
+        for num in self.table.summary():
+            row = self.table.row(num)
+            values = render(template, {'CheckName': row.CheckName, 'Severity': str(row.Severity),
+                                       'Observation': row.Observation, 'DateOf': row.DateOf})
+            yield [row.NodeName] + values[:columns-1]
+
+    def autocopy_row(self, fs):
+        """Row of the front sheet copied for every node, marked in the template by the 'AutoCopy' comment"""
         for cell in fs._cells.values():
             if cell.comment == 'AutoCopy':
-                fs_init_row = cell.row
                 cell.comment = None
-                break
-        file_number = len(os.listdir(self.dirs['inputDir']))
+                return cell.row
+        return 6
+
+    def writexls(self, filename, workers=1, inFiles=None):
+        start = time.perf_counter()
+        self.table = ZbResultTable()
+        self.wb = load_openpyxl().load_workbook(filename=self.template())
+        fs = self.wb['Front Sheet']
+        fs_init_row = self.autocopy_row(fs)
+        inFiles = self.logs() if inFiles is None else inFiles
+        file_number = len(inFiles)
         if file_number > 2:
-            fs.copy_rows(fs_init_row, file_number-2, above=False, copy_style=True, fill_formulae=True)
+            fs.reserve_rows(fs_init_row, file_number-2)
         else:
             print('Is need more than 2 log files!')
             return
         tmpl = self.wb['Controller log template']
-        for num, inFile in enumerate(os.listdir(self.dirs['inputDir'])):
-            ws = copy.copy(tmpl)
-            ws.title = inFile
-            self.wb._add_sheet(ws)
-        output = self.savexls(filename)
-        self.wb = openpyxl.load_workbook(filename=output)
+        errorRow = [tmpl.cell(row=5, column=col).value for col in range(1, tmpl.max_column+1)]
+        sheets = [self.wb.copy_worksheet(tmpl, self.node_name(inFile)) for inFile in inFiles]
+        openpyxlTime = time.perf_counter() - start
         try:
-            fs = self.wb['Front Sheet']
-            tmpl = self.wb['Controller log template']
-            for num, inFile in enumerate(os.listdir(self.dirs['inputDir'])):
+            fs_columns = fs.max_column
+            es = self.wb['Error list. Summary']
+            es_columns = es.max_column
+            logdate = None
+            for num, (inFile, (self.output, nodelogdate, checkStats)) in enumerate(zip(inFiles, self.results(inFiles, workers))):
                 print(inFile)
-                ws = self.wb[inFile]
-                with open(os.path.join(self.dirs['inputDir'], inFile), 'r') as f:
-                    self.log = f.read()
-                self.output = []
-                self.parseLog(inFile)
-                for cell in ws.rows[0]:
-                    cell.value = cell.value.replace('v<#LogDate#>', self.logdate) if cell.value else ''
-                es = self.wb['Error list. Summary']
-                escurrow = 5
-                for row in self.output:
-                    cur_row = int(row.Order)+5
-                    ws.copy_rows(cur_row, 1, above=False, copy_style=True, fill_formulae=True)
-                    for cell in ws.rows[cur_row-1]:
+                self.add_results(self.output, nodelogdate)
+                nodeStart = time.perf_counter()
+                ws = sheets[num]
+                ws_columns = ws.max_column
+                logdate = nodelogdate or logdate
+                for col in range(1, ws_columns+1):
+                    cell = ws.cell(row=1, column=col)
+                    cell.value = cell.value.replace('v<#LogDate#>', logdate) if cell.value else ''
+                ws.reserve_rows(5, len(self.output))
+                for cur_row, row in enumerate(self.output, 5):
+                    for col in range(1, ws_columns+1):
+                        cell = ws.cell(row=cur_row, column=col)
                         cell.value = cell.value.replace('v<#CheckName#>', row.CheckName) if cell.value else None
                         cell.value = cell.value.replace('v<#Severity#>', str(row.Severity)) if cell.value else None
                         cell.value = cell.value.replace('v<#Observation#>', row.Observation) if cell.value else None
                         cell.value = cell.value.replace('v<#DateOf#>', row.DateOf) if cell.value else None
-                    if row.Severity != Severity.Ok:
-                        es.copy_rows(escurrow, 1, above=False, copy_style=True, fill_formulae=True)
-                        for cell in es.rows[escurrow-1]:
-                            if cell.column == 'A':
-                                cell.value = inFile
-                            else:
-                                cell.value = ws['%s%s' % (get_column_letter(column_index_from_string(cell.column)-1), cur_row)].value
-                        escurrow += 1
                 # Nulling last row
-                for cell in ws.rows[cur_row]:
-                    cell.value = ''
+                for col in range(1, ws_columns+1):
+                    ws.cell(row=5+len(self.output), column=col).value = ''
                 cur_row = num+fs_init_row
-                for cell in fs.rows[cur_row-1]:
-                    cell.value = cell.value.replace('v<#FileName#>', inFile) if cell.value else None
-                    cell.value = cell.value.replace('v<#MaxRow#>', str(ws.max_row)) if cell.value else None
-                    formula = re.compile(r'f<#(.*)#>')
-                    if formula.search(str(cell.value)):
-                        cell.value = formula.sub(r'\1', cell.value).replace(';',',')
+                max_row = str(ws.max_row)
+                for col in range(1, fs_columns+1):
+                    cell = fs.cell(row=cur_row, column=col)
+                    cell.value = cell.value.replace('v<#FileName#>', ws.title) if cell.value else None
+                    cell.value = cell.value.replace('v<#MaxRow#>', max_row) if cell.value else None
+                    if FORMULA_RE.search(str(cell.value)):
+                        cell.value = FORMULA_RE.sub(r'\1', cell.value).replace(';',',')
                         cell.data_type = Cell.TYPE_FORMULA
+                self.write_stats(inFile, checkStats, time.perf_counter() - nodeStart)
+            # The summary of all the nodes at once: the rows are reserved by one shift and filled from the table
+            errors = list(self.summary_rows(errorRow, es_columns))
+            es.reserve_rows(5, len(errors))
+            for escurrow, values in enumerate(errors, 5):
+                for col, value in enumerate(values, 1):
+                    es.cell(row=escurrow, column=col).value = value
             if tmpl: self.wb.remove_sheet(tmpl)
         # except Exception, e:
             # raise e
         # else:
             # pass
         finally:
-            self.wb.save(output)
+            saveStart = time.perf_counter()
+            self.savexls(filename)
+            self.stats.write('run', nodes=file_number, workers=workers, wall=time.perf_counter() - start,
+                             openpyxl=openpyxlTime + time.perf_counter() - saveStart)
+            self.finish()
+
+    def writexls_stream(self, filename, workers=1, inFiles=None):
+        """Streaming variant of writexls for very large fleets: the report is a write-only workbook and
+        the rows of a node are written out as soon as its log is checked, so no controller sheet is kept
+        in memory. The values and formulae of the template are rendered, its cell styles are not copied."""
+        start = time.perf_counter()
+        self.table = ZbResultTable()
+        template = load_openpyxl().load_workbook(filename=self.template())
+        fs_tmpl = template['Front Sheet']
+        es_tmpl = template['Error list. Summary']
+        tmpl = template['Controller log template']
+        fs_init_row = self.autocopy_row(fs_tmpl)
+        inFiles = self.logs() if inFiles is None else inFiles
+        file_number = len(inFiles)
+        if file_number <= 2:
+            print('Is need more than 2 log files!')
+            return
+        front, errlist, controller = ([[cell.value for cell in row] for row in ws.rows] for ws in (fs_tmpl, es_tmpl, tmpl))
+        es_columns = es_tmpl.max_column
+        self.wb = load_openpyxl().Workbook(write_only=True)
+
+        def sheet(title, source):
+            ws = self.wb.create_sheet(title=title)
+            for key, dim in source.column_dimensions.items():
+                ws.column_dimensions[key].width = dim.width
+            return ws
+        fs = sheet('Front Sheet', fs_tmpl)
+        es = sheet('Error list. Summary', es_tmpl)
+        for row in front[:fs_init_row-1]:
+            fs.append(row)
+        for row in errlist[:4]:
+            es.append(row)
+        openpyxlTime = time.perf_counter() - start
+        try:
+            logdate = None
+            for num, (inFile, (self.output, nodelogdate, checkStats)) in enumerate(zip(inFiles, self.results(inFiles, workers))):
+                print(inFile)
+                self.add_results(self.output, nodelogdate)
+                nodeStart = time.perf_counter()
+                ws = sheet(self.node_name(inFile), tmpl)
+                logdate = nodelogdate or logdate
+                ws.append(render(controller[0], {'LogDate': logdate}))
+                for row in controller[1:4]:
+                    ws.append(row)
+                for row in self.output:
+                    values = render(controller[4], {'CheckName': row.CheckName, 'Severity': str(row.Severity),
+                                                    'Observation': row.Observation, 'DateOf': row.DateOf})
+                    ws.append(values)
+                # The rows of the node are complete, close its temporary file: only the front and error sheets stay open
+                ws.writer.close()
+                # The template row is copied for all the nodes but the last one, which takes the row below it
+                row = front[fs_init_row-1] if num < file_number-1 else front[fs_init_row]
+                fs.append(render(row, {'FileName': ws.title, 'MaxRow': str(len(controller)+len(self.output))}))
+                self.write_stats(inFile, checkStats, time.perf_counter() - nodeStart)
+            for values in self.summary_rows(controller[4], es_columns):
+                es.append(values)
+            replace = shift_refs(fs_init_row, file_number-2)
+            for row in front[fs_init_row+1:]:
+                fs.append([CELL_RE.sub(replace, value) if isinstance(value, str) and value.startswith('=') else value
+                           for value in row])
+        finally:
+            saveStart = time.perf_counter()
+            self.savexls(filename)
+            self.stats.write('run', nodes=file_number, workers=workers, wall=time.perf_counter() - start,
+                             openpyxl=openpyxlTime + time.perf_counter() - saveStart)
+            self.finish()
+
+    def write_results(self, filename, fmt, workers=1, inFiles=None):
+        """Results of all the logs in the format fmt without the template and openpyxl:
+        csv, jsonl - a row per check of a node, written as soon as the log is checked;
+        columnar - ZbResultTable.save of the results of all the logs.
+        """
+        start = time.perf_counter()
+        self.table = ZbResultTable()
+        inFiles = self.logs() if inFiles is None else inFiles
+        extension = {'csv': '.csv', 'jsonl': '.jsonl', 'columnar': '.zbr'}[fmt]
+        fields = ('Node', 'LogDate', 'Order', 'CheckName', 'Severity', 'Observation', 'DateOf') + \
+            ZbResultTable.counters + ('alarmsDetail',)
+        with open(self.output_path(filename, extension), 'wb' if fmt == 'columnar' else 'w',
+                  **({} if fmt == 'columnar' else {'encoding': 'utf-8', 'newline': ''})) as f:
+            if fmt == 'csv':
+                writer = csv.writer(f)
+                writer.writerow(fields)
+            try:
+                for inFile, (self.output, nodelogdate, checkStats) in zip(inFiles, self.results(inFiles, workers)):
+                    print(inFile)
+                    self.add_results(self.output, nodelogdate)
+                    nodeStart = time.perf_counter()
+                    for row in self.output:
+                        values = [row.NodeName, nodelogdate or '', row.Order, row.CheckName, str(row.Severity),
+                                  row.Observation, row.DateOf] + [getattr(row, counter) for counter in ZbResultTable.counters]
+                        if fmt == 'csv':
+                            writer.writerow(values + ['\n'.join(row.alarmsDetail)])
+                        elif fmt == 'jsonl':
+                            f.write(json.dumps(dict(zip(fields, values + [row.alarmsDetail])), ensure_ascii=False) + '\n')
+                    self.write_stats(inFile, checkStats, time.perf_counter() - nodeStart)
+                if fmt == 'columnar':
+                    self.table.save(f)
+            finally:
+                self.stats.write('run', nodes=len(inFiles), workers=workers, wall=time.perf_counter() - start,
+                                 openpyxl=0.0)
+                self.finish()
+
+    def report(self, filename, formats, workers=1, writeOnly=False, inFiles=None):
+        """Writes the results of the logs inFiles (all of the input directory if None) in every format of formats"""
+        for fmt in formats:
+            if fmt == 'xlsx':
+                writexls = self.writexls_stream if writeOnly else self.writexls
+                writexls(filename, workers=workers, inFiles=inFiles)
+            else:
+                self.write_results(filename, fmt, workers=workers, inFiles=inFiles)
+
+    def watch(self, filename, formats, workers=1, writeOnly=False, interval=5.0):
+        """Checks the logs as they land in the input directory until interrupted (Ctrl+C).
+        A log is complete once its size and modification time stay the same for interval seconds, then it is
+        checked at once and the reports of all the complete logs are written over the previous ones.
+        The checks, the alarms reference, the results of the logs checked before and the process pool of the workers
+        stay in memory."""
+        self.keepResults = True
+        self.overwriteOutput = True
+        self.make_dirs()
+        last = {}
+        reported = set()
+        if workers > 1:
+            self.pool = self.worker_pool(workers)
+        try:
+            while True:
+                current = {}
+                for inFile in os.listdir(self.dirs['inputDir']):
+                    try:
+                        current[inFile] = self.checked_key(inFile)
+                    except OSError:
+                        continue
+                complete = sorted(inFile for inFile, key in current.items() if last.get(inFile) == key)
+                last = current
+                keys = set(current[inFile] for inFile in complete)
+                if keys != reported:
+                    logs = self.logs(complete)
+                    for result in self.results(logs, workers):
+                        pass
+                    # The results of the logs removed or changed since are not needed any more
+                    logKeys = set(self.checked_key(log) for log in logs)
+                    self.checked = {key: result for key, result in self.checked.items() if key in logKeys}
+                    print('%d logs complete, writing the report' % len(logs))
+                    self.report(filename, formats, workers, writeOnly, logs)
+                    reported = keys
+                time.sleep(interval)
+        finally:
+            if self.pool:
+                self.stop_pool(self.pool)
+                self.pool = None
+
+
+analyser = None
+
+
+def init_worker(settings, checks=None):
+    """Initializer of the process pool: the analyser of the process takes the settings and the checks
+    (captions) of the main one. Ctrl+C is left to the main process, which stops the pool"""
+    global analyser
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    analyser = ZbAnalyser()
+    for name, value in settings.items():
+        setattr(analyser, name, value)
+    if checks is not None:
+        analyser.select_checks(checks)
+
+
+def analyse_log(task):
+    """Worker of the process pool: checks one log by the analyser of the process.
+    :param task: the log and its section (see ZbAnalyser.sections), None if it is not a section of a session log
+    """
+    global analyser
+    if analyser is None:
+        analyser = ZbAnalyser()
+    inFile, section = task
+    if section:
+        analyser.sections[inFile] = section
+    return analyser.analyse(inFile)
 
 
 def main():
+    parser = argparse.ArgumentParser(description='zbAnalyser')
+    parser.add_argument('-j', '--workers', type=int, default=1, help='number of processes checking the logs')
+    parser.add_argument('--write-only', action='store_true',
+                        help='stream the report row by row without template styles (for very large fleets)')
+    parser.add_argument('--format', default='xlsx',
+                        help='comma separated formats of the results: xlsx (the report from the template), '
+                             'csv, jsonl, columnar (ZbResultTable file .zbr); the logs are checked once for all of them')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='check all the logs again instead of taking the results of unchanged ones from ./cache')
+    parser.add_argument('--watch', type=float, nargs='?', const=5.0, metavar='SECONDS',
+                        help='keep watching the input directory and update the reports as the logs land in it, '
+                             'a log is complete when it is not changed for SECONDS (5 by default)')
+    parser.add_argument('--no-history', action='store_true',
+                        help='do not store the KPI, alarm counts, release and uptime of the nodes in history.sqlite')
+    parser.add_argument('--regrade', nargs='?', const='', metavar='LOGDATE',
+                        help='grade the main KPI of the nodes from history.sqlite (up to LOGDATE, YYYY-MM-DD) by the '
+                             'limits of Criteria.xlsx without reading the logs, prints the nodes which are not Ok')
+    parser.add_argument('--check', action='append', metavar='NAME',
+                        help='run only this check (its caption or class name), may be repeated')
+    parser.add_argument('--severity', choices=[severity.name for severity in Severity if severity != Severity.Ok],
+                        help='run only the checks that can report this severity or a worse one')
+    parser.add_argument('--count-matches', action='store_true',
+                        help='count the regex matches of every check in the statistics of the log directory '
+                             '(every pattern call is then counted, which slows the checks down)')
+    parser.add_argument('--profile', action='store_true',
+                        help='dump cProfile stats of the run into the log directory (the main process only)')
+    args = parser.parse_args()
     zloyB = ZbAnalyser()
+    zloyB.useCache = not args.no_cache
+    zloyB.countMatches = args.count_matches
+    zloyB.useHistory = not args.no_history
+    try:
+        zloyB.select_checks(args.check, Severity[args.severity] if args.severity else None)
+    except ValueError as e:
+        parser.error(str(e))
     # zloyB.init_alarms()
     # for row in zloyB.alarms:
         # print(row)
-    zloyB.writexls('Preemptive_Support_Report_')
+    formats = args.format.split(',')
+    for fmt in formats:
+        if fmt not in ('xlsx', 'csv', 'jsonl', 'columnar'):
+            parser.error('unknown format %s' % fmt)
+    if args.regrade is not None:
+        grades = zloyB.kpi_rules().grade_history(zloyB.history, args.regrade or None)
+        for node, severity in sorted(grades.items(), key=lambda item: (item[1].value[0], item[0])):
+            if severity != Severity.Ok:
+                print('%s\t%s' % (node, severity))
+        return
+    # The formats after the first one take the results of the logs from memory
+    zloyB.keepResults = len(formats) > 1
+    profile = None
+    if args.profile:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+    try:
+        if args.watch is not None:
+            zloyB.watch('Preemptive_Support_Report_', formats, args.workers, args.write_only, args.watch)
+        else:
+            zloyB.report('Preemptive_Support_Report_', formats, args.workers, args.write_only)
+    except KeyboardInterrupt:
+        print('Stopped')
+    finally:
+        if profile:
+            profile.disable()
+            profile.dump_stats(zloyB.stats.profilePath)
 
     # BSC => GRAN
     # RNC => WRAN
@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""zbAnalyser as a library: import zbAnalyser gives the module zbAnalyser.0.0.12.py, whose file name
+is not importable by itself.
+
+    import pathlib, zbAnalyser
+    analyser = zbAnalyser.ZbAnalyser()
+    rows = analyser.check(pathlib.Path('RNC01.log'))
+"""
+import importlib.util
+import os
+import sys
+
+_spec = importlib.util.spec_from_file_location(__name__, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                      'zbAnalyser.0.0.12.py'))
+_module = importlib.util.module_from_spec(_spec)
+sys.modules[__name__] = _module
+_spec.loader.exec_module(_module)
@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark of zbAnalyser on synthetic moshell logs
+
+Generates node logs with the output of every command used by the checks, times parseLog per check,
+init_alarms and writexls over fleets of generated logs and prints the results as JSON.
+Two result files are compared by --compare, the exit code is 1 if some timing got slower than --tolerance.
+The exit code is 1 as well if a 10 times larger log is indexed more than --max-ratio times longer,
+--scaling runs only that check.
+
+> python zbBenchmark.py -o bench.json
+> python zbBenchmark.py --nodes 1,100 --compare bench.json
+> python zbBenchmark.py --scaling --max-ratio 20
+"""
+
+import argparse
+import contextlib
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import openpyxl
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(ROOT, 'zbAnalyser.0.0.12.py')
+REPORT = 'Preemptive_Support_Report_'
+
+ALARMS = ('Loss of System Clock', 'Ambient Temperature High', 'Link Failure', 'Ranap_LocalFailure',
+          'Ambient Temperature Unacceptable', 'License Key File Fault', 'Alarm Indication Signal - P',
+          'Plug-In Unit General Problem', 'Resource Allocation Failure', 'Remote Site Unavailable')
+EVENTS = (('ALARM', 'RncFunction=1,IuLink=%d,Ranap=1', 'Ranap_CNInitiatedResetResource MajorAlarm'),
+          ('ALARM', 'ManagedElement=1,IpEthPacketDataRouter=%d', 'IpEthPacketDataRouter_CnNotRespondingToGTPEcho'),
+          ('EVENT', 'ManagedElement=1,TimingUnit=%d', 'A Non-Local MAU Has Been Chosen as the Active Client'))
+KPI = ('HsAccess', 'HsDrop', 'PsAccess', 'PSCCSR', 'PsDrop', 'RrcSuc', 'SpchAccess', 'PsRabSucc', 'SpchRabSuc',
+       'SpchDrop')
+
+
+def generate_log(node='RNC01', alarms=50, events=2000, days=7, mos=200, boards=8, seed=1):
+    """Synthetic moshell log of the node with the output of all the commands of the checks.
+    :param alarms: Number of active alarms in the alt output.
+    :param events: Number of lgesmr entries over the last days, about 3% of them are the signatures of the check
+    and 1% are crashes.
+    :param mos: Number of MOs in the st all 1.*0 table.
+    :param boards: Number of boards in the lh coremp and lh cenmp blocks (up to 90).
+    """
+    r = random.Random(seed)
+    boards = max(2, min(boards, 90))
+    stamp = '161020-10:%02d:%02d 10.0.0.1 15.0k RNC_NODE_MODEL_W_1_1 stopfile=/tmp/1234\n'
+    clock = iter(range(3600))
+    ts = lambda: stamp % divmod(next(clock), 60)
+    prompt = node + '> '
+    hdr = 'Proxy  Adm State     Op. State     MO\n' + '=' * 80 + '\n'
+    tail = '=' * 80 + '\nTotal: %d MOs\n\n'
+    out = ['Logging to file /home/user/moshell_logfiles/logs/2016-10-20/%s.log\n' % node,
+           prompt + 'lt all\n' + ts() + 'Checking MOM version...\nTotal: 1234 MOs\n\n']
+
+    out.append(prompt + 'alt\n' + ts() + 'Connecting to 10.0.0.1:56834 (CorbaSecurity=OFF)\n')
+    out.append('Date & Time (Local) S Specific Problem                    MO (Cause/AdditionalInfo)\n' + '=' * 90 + '\n')
+    for i in range(alarms):
+        out.append('2016-10-19 %02d:%02d:11 %s %-35s Subrack=1,Slot=%d (info)\n' % (
+            i // 60 % 24, i % 60, r.choice('cMmw'), r.choice(ALARMS), i % 28))
+    out.append('>>> Total: %d Alarms (1 Critical, 1 Major)\n\n' % alarms)
+
+    # The checks look for 'lgesmr 7d', busy nodes are simulated by more days of entries in its output
+    out.append(prompt + 'lgesmr 7d\n')
+    out.append(ts() + 'Timestamp (UTC)     Type  Merged Log Entry\n' + '=' * 90 + '\n')
+    first = datetime(2016, 10, 20) - timedelta(days=days)
+    for i in range(events):
+        date = (first + timedelta(hours=i * days * 24 // events)).strftime('%Y-%m-%d %H')
+        x = r.random()
+        if x < 0.03:
+            kind, mo, text = r.choice(EVENTS)
+            out.append('%s:00:00 %s  %s  %s\n' % (date, kind, mo % r.randint(1, 3), text))
+        elif x < 0.04:
+            out.append('%s:00:00 CRASH  Crash on %d, device=%d SPM  Crash text\n' % (
+                date, r.choice((1, 1, 2)), r.choice((1234, 1234, 1235))))
+        else:
+            out.append('%s:00:00 EVENT  ManagedElement=1,Equipment=1,Subrack=1,Slot=%d,PlugInUnit=1  '
+                       'Board restarted, cause %d\n' % (date, i % 28, i))
+    out.append('\n')
+
+    out.append(prompt + 'lgd\n' + ts())
+    out.append('Timestamp (UTC)     RestartType/Reason     Configuration Version    SwRelease   CPP Downtime  '
+               'Appl. Downtime  JVM Downtime\n' + '=' * 90 + '\n')
+    out.append('2016-10-15 10:00:00 Spontaneous            CV_1                     CXP1        10s           20s   30s\n')
+    out.append('2016-09-01 10:00:00 Manual                 CV_1                     CXP1        10s           20s   30s\n')
+    out.append('\nNode uptime since last restart: 432000 seconds (5 days, 0 hours, 0 minutes)\n\n')
+
+    out.append(prompt + 'lh coremp readclock\n' + ts())
+    for board in range(10, 10 + boards):
+        out.append('$ lhsh 00%d00 readclock\n00%d00: Date: 2016-10-20, Time: 10:00:05\n' % (board, board))
+    out.append('\n')
+
+    out.append(prompt + 'get Synchronization=1\n' + ts())
+    out.append('=' * 80 + '\n211  TransportNetwork=1,Synchronization=1\n' + '=' * 80 + '\n')
+    out.append('nodeSystemClock                      2 (LOCKED_MODE)\nsyncReference                        t[2] =\n')
+    out.append(' >>> syncReference = TransportNetwork=1,TuSyncRef=1\n >>> syncReference = TransportNetwork=1,E1T1Ttp=1\n')
+    out.append('syncRefStatus                        i[2] = 1 2 (OK OK)\n' + tail % 1)
+    out.append(prompt + 'st tusync\n' + ts() + hdr)
+    out.append(' 1234    1 (UNLOCKED)  1 (ENABLED)   TransportNetwork=1,TuSyncRef=1\n' + tail % 1)
+
+    out.append(prompt + 'st m3ua\n' + ts() + hdr)
+    for i in range(boards):
+        out.append(' %d    1 (UNLOCKED)  1 (ENABLED)   Sctp=1,M3uAssociation=%s%da\n' % (1281 + i, ('CS', 'PS')[i % 2], i))
+    out.append(' 1280   7 (DISABLED)  Sctp=1,M3uAssociation=RS2abc\n' + tail % (boards + 1))
+
+    out.append(prompt + 'std\n' + ts())
+    out.append('-' * 80 + '\nType  %Up  Total  Enabled(1)  Disabled(0)  Locked(L)  Active(A)  Idle(I)  Busy(B)  '
+               'Unallocated\n' + '-' * 80 + '\n')
+    for device in ('CC', 'DC', 'PDR'):
+        out.append('%-5s 100%%   %d    %d          0            0          10         10       0        0\n' % (
+            device, boards * 4, boards * 4))
+    out.append('-' * 80 + '\nTOT   100%   70    70          0            0          30         20       0        0\n\n')
+
+    out.append(prompt + 'strt\n' + ts())
+    out.append('Following 10 sites are up:\n RBS1 RBS2\nFollowing 2 sites are totally or partially unavailable:\n'
+               ' RBS11 RBS12\n' + '-' * 60 + '\n\n')
+    out.append('Site availability: 10 of 12 sites are fully operational (83.33 %)\n')
+    out.append('Unlocked cell availability: 50 of 60 unlocked cells are up (83.33 %)\n\n')
+
+    out.append(prompt + 'st ranap\n' + ts() + hdr)
+    out.append(' 500  1 (UNLOCKED)  1 (ENABLED)  RncFunction=1,CnOperator=1,IuLink=1,Ranap=CS\n')
+    out.append(' 501  1 (UNLOCKED)  0 (DISABLED)  RncFunction=1,CnOperator=1,IuLink=2,Ranap=PS\n' + tail % 2)
+    out.append(prompt + 'cvls\n' + ts() + "CV list\n>>> Total: 25 CV's, 3 UP's\n\n")
+    out.append(prompt + 'dbc\n' + ts() + '=' * 40 + '\nDatabase Consistency Check (may take time)\n' + '=' * 40 + '\n')
+    out.append('Dangling references found:  NO\nMissing tables: NO\nConclusion: the database is consistent\n\n')
+    out.append(prompt + 'cvcu\n' + ts())
+    out.append('Current UP: CXP9012345/1 R1A W15.1 (RNC_W15B_R1A)\n' + '-' * 40 + '\n')
+    out.append('Startable UP: CXP9012345/1 R1A W15.1 (RNC_W15B_R1A)\n\n')
+
+    out.append(prompt + 'steg\n' + ts())
+    out.append('=' * 80 + '\nBoard  Port  Speed   Duplex  Prio  State  Edge     PbitQMap  Mode  Vlans\n' + '=' * 80 + '\n')
+    for i in range(boards):
+        out.append('cmxb   %-5d 1000    full    1     up     edge_on  1,2,3     m     10,20\n' % i)
+    out.append(tail % boards)
+    out.append(prompt + 'stip\n' + ts())
+    out.append('=' * 80 + '\nBoard  Port  Speed   Vlans   DscpPbitMap\n' + '=' * 80 + '\n')
+    for i in range(boards):
+        out.append('ipg    %-5d 1000    10      0:1,2:3\n' % i)
+    out.append(tail % boards)
+
+    for device in ('cc', 'dc', 'pdr'):
+        out.append(prompt + 'lh cenmp drhcendh %s\n' % device + ts() + '$ lhsh 001400 drhcendh %s\n' % device)
+        out.append('001400: deviceId devFroId boardPiuFroId admState opState capability subrack servingRhModuleId '
+                   'linkHandlerName ptmLm faultTable state msgBoard\n')
+        ok = '[linkEstablished allocatedSp allocatedRh ]' if device == 'pdr' else \
+            '[linkEstablished synced allocatedSp allocatedRh ]'
+        for i in range(boards * 4):
+            out.append('001400: %d 2 3 UNLOCKED ENABLED 1 1 1 lh1 0 x %s %s\n' % (i, ('BUSY', 'IDLE')[i % 2], ok))
+        out.append('001400: Summary of resource handlers:\n')
+        out.append('001400: moduleId boardPiuFroId moduleRole connected subrack noSpDev capability allocatedShare '
+                   'properShare pendingRebalance\n')
+        for i in range(boards):
+            out.append('001400: %d 2 3 4\n' % (i + 1))
+        out.append('=' * 40 + '\n\n')
+
+    out.append(prompt + 'st all 1.*0\n' + ts() + hdr)
+    for i in range(mos):
+        out.append(' %d    1 (UNLOCKED)  0 (DISABLED)  RncFunction=1,UtranCell=C%d\n' % (100 + i, i))
+    out.append(tail % mos)
+
+    out.append(prompt + 'get ManagedElement=1 healthCheckResult|healthCheckSchedule\n' + ts())
+    out.append('=' * 80 + '\nMO                          Attribute               Value\n' + '=' * 80 + '\n')
+    out.append('ManagedElement=1            healthCheckResult Struct{3}\n')
+    out.append(' >>> 1.healthCheckResultCode = 0 (OK)\n >>> 2.message = fine\n >>> 3.startTime = 2016-10-20 03:00:00\n')
+    out.append('ManagedElement=1            healthCheckSchedule t[1] =\n')
+    out.append(' >>> Struct[0] has 2 members:\n >>> 1.time = 03:00\n >>> 2.weekday = 0 (MONDAY)\n' + tail % 1)
+
+    out.append(prompt + 'lkra\n' + ts() + 'Sr  Mod  S  GPB      nIub  CellGPB  CellCC  nCC\n' + '-' * 60 + '\n')
+    for mod in range(boards):
+        out.append('MS  %d    1  ES%d      %d    30       30      1\n' % (mod, mod, r.randint(4, 12)))
+    out.append('-' * 60 + '\n\nCell repartition by Board:\n\n')
+
+    out.append(prompt + 'pmr -m 12 -r 1\n' + ts() + 'Object Counter  \n')
+    for name in KPI:
+        out.append(' %-20s %s\n' % (name, 'N/A' if name == 'PsDrop' else '%.1f' % (
+            r.uniform(0.1, 2) if name.endswith('Drop') else r.uniform(95, 100))))
+    out.append('\n')
+
+    out.append(prompt + 'lh coremp mirror stat\n' + ts())
+    out.append('$ lhsh 001000 mirror stat\nPeer Disk: Connected\nMount Status: Active\nPeer Disk Status: Valid\n')
+    out.append('$ lhsh 001100 mirror stat\nPeer Disk: Connected\nMount Status: Passive\nPeer Disk Status: Valid\n\n')
+    out.append(prompt + 'st SwitchInternalLink\n' + ts() + hdr)
+    out.append(' 700  1 (UNLOCKED)  1 (ENABLED)  Subrack=1,SwitchInternalLink=1\n' + tail % 1)
+    out.append(prompt + 'get SwitchCoreUnit state\n' + ts())
+    out.append('=' * 80 + '\nMO                          Attribute               Value\n' + '=' * 80 + '\n')
+    out.append('Subrack=1,SwitchCoreUnit=1  state  1 (UNLOCKED) 1 (ENABLED)\n' + tail % 1)
+    out.append(prompt + 'q\n\nBye...\n')
+    return ''.join(out)
+
+
+def load_analyser(path=SCRIPT):
+    """Module of zbAnalyser: its file name has dots and is not importable by name"""
+    spec = importlib.util.spec_from_file_location('zbAnalyser', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['zbAnalyser'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def workdir(path, logs):
+    """Prepares the directory to run zbAnalyser in: template, alarms reference and the input logs"""
+    shutil.copytree(os.path.join(ROOT, 'template'), os.path.join(path, 'template'))
+    shutil.copy(os.path.join(ROOT, 'Alarms_and_events.xlsx'), path)
+    os.mkdir(os.path.join(path, 'input'))
+    for num, log in enumerate(logs):
+        with open(os.path.join(path, 'input', 'RNC%04d.log' % num), 'w') as f:
+            f.write(log)
+
+
+def quiet():
+    """zbAnalyser prints a line per check, keep it out of the benchmark output"""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def bench_parse(zb, log, repeat):
+    """Best of repeat runs of parseLog over the log: total, command index, MO state table and every check
+    (evaluate of its outputs plus evaluate_states for checks of the MO states)"""
+    best = {}
+    for _ in range(repeat):
+        analyser = zb.ZbAnalyser()
+        timings = {}
+        wrapped = []
+
+        def timed(key, method):
+            def run(*args):
+                start = time.perf_counter()
+                try:
+                    return method(*args)
+                finally:
+                    timings[key] = timings.get(key, 0) + time.perf_counter() - start
+            return run
+        for check in analyser.checks:
+            for name in ('evaluate', 'evaluate_states') if check.states else ('evaluate',):
+                setattr(check, name, timed(check.caption, getattr(check, name)))
+                wrapped.append((check, name))
+        analyser.mo_states = timed('moStates', analyser.mo_states)
+        try:
+            start = time.perf_counter()
+            analyser.index = zb.ZbCommandIndex(log, analyser.commands())
+            timings['index'] = time.perf_counter() - start
+            with quiet():
+                analyser.parseLog('RNC0000')
+            timings['total'] = time.perf_counter() - start
+        finally:
+            for check, name in wrapped:
+                delattr(check, name)
+        for key, value in timings.items():
+            best[key] = min(value, best.get(key, value))
+    return best
+
+
+def bench_crlf(zb, log):
+    """check of the log with Unix and with Windows line breaks: time of both and whether they give the same rows"""
+    result = {}
+    rows = {}
+    for key, data in (('lf', log.encode('utf-8')), ('crlf', log.replace('\n', '\r\n').encode('utf-8'))):
+        analyser = zb.ZbAnalyser()
+        start = time.perf_counter()
+        with quiet():
+            rows[key] = [(row.CheckName, str(row.Severity)) for row in analyser.check(data, 'RNC0000')]
+        result[key] = time.perf_counter() - start
+    result['rows'] = len(rows['crlf'])
+    result['same'] = rows['lf'] == rows['crlf']
+    return result
+
+
+def bench_states(zb, log):
+    """Rows of the checks of the MO states run with all the checks and run alone: they are the same if a check
+    sees only the st outputs of its own commands"""
+    analyser = zb.ZbAnalyser()
+    with quiet():
+        rows = {row.CheckName: (str(row.Severity), row.Observation) for row in analyser.check(log, 'RNC0000')}
+    result = {'checks': 0, 'same': True}
+    for check in analyser.checks:
+        if check.states:
+            alone = zb.ZbAnalyser()
+            alone.select_checks([check.caption])
+            with quiet():
+                row = alone.check(log, 'RNC0000')[0]
+            result['checks'] += 1
+            result['same'] = result['same'] and rows[check.caption] == (str(row.Severity), row.Observation)
+    return result
+
+
+def bench_scaling(zb, sizes, repeat, factor=10):
+    """Best of repeat runs of the command index over the log of the sizes and over a log factor times larger
+    (longer alt, lgesmr and st outputs): times of both and their ratio, about factor if the index is linear"""
+    result = {'factor': factor}
+    commands = zb.ZbAnalyser().commands()
+    for key, scale in (('1x', 1), ('%dx' % factor, factor)):
+        log = generate_log(**dict(sizes, alarms=sizes['alarms'] * scale, events=sizes['events'] * scale,
+                                  mos=sizes['mos'] * scale))
+        best = None
+        for _ in range(max(repeat, 3)):
+            start = time.perf_counter()
+            zb.ZbCommandIndex(log, commands)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        result[key] = {'bytes': len(log), 'index': best}
+    result['ratio'] = result['%dx' % factor]['index'] / result['1x']['index']
+    return result
+
+
+def bench_alarms(zb):
+    """init_alarms without and with the sidecar cache of the reference"""
+    analyser = zb.ZbAnalyser()
+    cache = analyser.referenceError + '.cache'
+    if os.path.exists(cache):
+        os.remove(cache)
+    result = {}
+    for key in ('cold', 'warm'):
+        analyser = zb.ZbAnalyser()
+        start = time.perf_counter()
+        with quiet():
+            analyser.init_alarms()
+        result[key] = time.perf_counter() - start
+    result['alarms'] = len(analyser.alarms)
+    return result
+
+
+def bench_report(zb, nodes, workers, stream):
+    """writexls (or writexls_stream) over a fleet of generated logs, the analysis of the logs included"""
+    result = {'nodes': nodes}
+    if nodes < 3:
+        result['writexls'] = None
+        result['note'] = 'writexls needs at least 3 logs'
+        return result
+    analyser = zb.ZbAnalyser()
+    writexls = analyser.writexls_stream if stream else analyser.writexls
+    start = time.perf_counter()
+    with quiet():
+        writexls(REPORT, workers=workers)
+    result['writexls'] = time.perf_counter() - start
+    result['per_node'] = result['writexls'] / nodes
+    output = os.listdir(analyser.dirs['outputDir'])
+    result['bytes'] = os.path.getsize(os.path.join(analyser.dirs['outputDir'], output[0])) if output else 0
+    # The same logs again: the results come from the cache of the first run
+    start = time.perf_counter()
+    with quiet():
+        writexls(REPORT, workers=workers)
+    result['cached'] = time.perf_counter() - start
+    return result
+
+
+def flatten(data, prefix=''):
+    """Numeric leaves of the nested results: 'parse.checks.Check active Alarms' -> seconds"""
+    leaves = {}
+    for key, value in data.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            leaves.update(flatten(value, name + '.'))
+        elif isinstance(value, float) and key != 'ratio':
+            # The scaling ratio is not a timing, --max-ratio bounds it
+            leaves[name] = value
+    return leaves
+
+
+def compare(old, new, tolerance, floor=0.005):
+    """Timings of new slower than tolerance times old ones, timings under floor seconds are noise"""
+    old, new = flatten(old['results']), flatten(new['results'])
+    slower = []
+    for name in sorted(set(old) & set(new)):
+        if new[name] > floor and new[name] > old[name] * tolerance:
+            slower.append((name, old[name], new[name]))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='zbAnalyser benchmark')
+    parser.add_argument('--nodes', default='1,100,1000', help='fleet sizes of the writexls runs, comma separated')
+    parser.add_argument('--alarms', type=int, default=5000, help='alarms in the alt output of the big log')
+    parser.add_argument('--events', type=int, default=200000, help='lgesmr entries of the big log')
+    parser.add_argument('--days', type=int, default=21, help='days covered by the lgesmr entries')
+    parser.add_argument('--mos', type=int, default=20000, help='MOs in the st all table of the big log')
+    parser.add_argument('--boards', type=int, default=64, help='boards in the lh coremp/cenmp blocks of the big log')
+    parser.add_argument('--fleet-events', type=int, default=2000, help='lgesmr entries of each fleet log')
+    parser.add_argument('--repeat', type=int, default=3, help='parseLog runs, the best one is reported')
+    parser.add_argument('-j', '--workers', type=int, default=1, help='processes of writexls')
+    parser.add_argument('--write-only', action='store_true', help='time writexls_stream instead of writexls')
+    parser.add_argument('-o', '--output', help='JSON file of the results, stdout by default')
+    parser.add_argument('--compare', help='JSON file of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='slowdown ratio reported by --compare')
+    parser.add_argument('--scaling', action='store_true',
+                        help='only index the big log and a 10 times larger one (see --max-ratio)')
+    parser.add_argument('--max-ratio', type=float, default=20,
+                        help='the exit code is 1 if the 10 times larger log is indexed more than that times longer')
+    args = parser.parse_args()
+
+    with open(SCRIPT, 'rb') as f:
+        version = hashlib.sha1(f.read()).hexdigest()
+    cwd = os.getcwd()
+    tmp = tempfile.mkdtemp(prefix='zbBenchmark.')
+    try:
+        base = os.path.join(tmp, 'base')
+        workdir(base, ())
+        os.chdir(base)
+        zb = load_analyser()
+        sizes = dict(alarms=args.alarms, events=args.events, days=args.days, mos=args.mos, boards=args.boards)
+        results = {'scaling': bench_scaling(zb, sizes, args.repeat)}
+        fleet = None
+        if not args.scaling:
+            log = generate_log(**sizes)
+            results.update({'parse': dict(bench_parse(zb, log, args.repeat), bytes=len(log)),
+                            'init_alarms': bench_alarms(zb),
+                            'crlf': bench_crlf(zb, log),
+                            'states': bench_states(zb, log),
+                            'writexls': {}})
+            parse = results['parse']
+            parse['checks'] = {check.caption: parse.pop(check.caption) for check in zb.ZbAnalyser().checks
+                               if check.caption in parse}
+            fleet = dict(alarms=50, events=args.fleet_events, days=7, mos=200, boards=8)
+            for nodes in (int(n) for n in args.nodes.split(',')):
+                path = os.path.join(tmp, 'fleet%d' % nodes)
+                workdir(path, (generate_log('RNC%04d' % num, seed=num, **fleet) for num in range(nodes)))
+                os.chdir(path)
+                results['writexls'][str(nodes)] = bench_report(zb, nodes, args.workers, args.write_only)
+                os.chdir(base)
+                shutil.rmtree(path)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp, ignore_errors=True)
+    report = {'date': datetime.now().isoformat(timespec='seconds'),
+              'version': version,
+              'python': platform.python_version(),
+              'openpyxl': openpyxl.__version__,
+              'platform': platform.platform(),
+              'params': dict(vars(args), big=sizes, fleet=fleet),
+              'results': results}
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    scaling = results['scaling']
+    if scaling['ratio'] > args.max_ratio:
+        print('A %d times larger log is indexed %.1f times longer' % (scaling['factor'], scaling['ratio']),
+              file=sys.stderr)
+        sys.exit(1)
+    if args.scaling:
+        return
+    if not results['crlf']['same']:
+        print('A log with Windows line breaks gives other rows than the same log with Unix ones', file=sys.stderr)
+        sys.exit(1)
+    if not results['states']['same']:
+        print('A check of the MO states gives other rows when run with the other checks', file=sys.stderr)
+        sys.exit(1)
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        slower = compare(old, report, args.tolerance)
+        for name, before, after in slower:
+            print('%s: %.3fs -> %.3fs (x%.2f)' % (name, before, after, after / before), file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()